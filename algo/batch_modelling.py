@@ -0,0 +1,263 @@
+"""
+This module contains vectorized counterparts of algo.modelling.
+Intrinsic values of many (ticker, date) rows are calculated in a single call using NumPy arrays.
+Rows that algo.modelling.get_intrinsic_value would reject are flagged by status codes.
+"""
+
+import numpy as np
+import pandas as pd
+import algo.constants as const
+import algo.data_acquisition as da
+import algo.fetched_data as fd
+import algo.fingerprints as fingerprints
+import algo.fundamentals as fundamentals
+import algo.modelling as model
+import algo.profiling as profiling
+
+N_PROJECTION_YEARS = 5
+
+STATUS_OK = 0
+STATUS_MISSING_TAX_INPUTS = 1
+STATUS_MISSING_INTEREST_EXPENSE = 2
+STATUS_MISSING_BETA = 3
+STATUS_MISSING_SHARE_PRICE = 4
+STATUS_ZERO_SHARES = 5
+STATUS_MISSING_OPERATING_INCOME = 6
+STATUS_MISSING_CASH_FLOW_INPUTS = 7
+
+# error messages as reported by modelling.get_intrinsic_value_wrapper
+STATUS_MESSAGES = {
+    STATUS_OK: '',
+    STATUS_MISSING_TAX_INPUTS: 'Error line: effective_tax_rate = income_tax / pretax_income',
+    STATUS_MISSING_INTEREST_EXPENSE: 'Error line: cost_of_debt = interest_expense / total_long_term_debt',
+    STATUS_MISSING_BETA: 'Error: missing beta',
+    STATUS_MISSING_SHARE_PRICE: 'Error: missing share price',
+    STATUS_ZERO_SHARES: 'Error: shares outstanding are zero or missing',
+    STATUS_MISSING_OPERATING_INCOME: 'Error: missing operating income',
+    STATUS_MISSING_CASH_FLOW_INPUTS: 'Error line: reinvestment_operations_part = net_cash_operating - net_income - '
+                                     'if_none(share_based_compensation, 0)',
+}
+
+
+def _set_status(status, condition, code):
+    """Sets status code where condition holds and no earlier error was flagged."""
+    status[(status == STATUS_OK) & condition] = code
+
+
+@profiling.timed('batch.dcf')
+def calc_dcf_inputs(values, mask, share_price, beta, erp, rf_rate, growth_rate):
+    """Calculates WACC, projected FCFF and equity residual for all rows.
+    values and mask are (n_rows, n_items) arrays with columns ordered as const.FUNDAMENTAL_CONCEPTS.
+    Returns dictionary of arrays, rows with non-zero status are not valid.
+    """
+    items = list(const.FUNDAMENTAL_CONCEPTS.keys())
+    values = np.asarray(values, dtype=float)
+    mask = np.asarray(mask, dtype=bool)
+    share_price = np.asarray(share_price, dtype=float)
+    beta = np.asarray(beta, dtype=float)
+
+    def col(item):
+        return values[:, items.index(item)]
+
+    def has(item):
+        return mask[:, items.index(item)]
+
+    def if_none(item, default):
+        return np.where(has(item), col(item), default)
+
+    status = np.full(values.shape[0], STATUS_OK, dtype=np.int8)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # cost of debt
+        total_long_term_debt = if_none('long_term_debt', 0) + if_none('long_term_lease', 0)
+        _set_status(status, ~(has('income_tax') & has('pretax_income')), STATUS_MISSING_TAX_INPUTS)
+        effective_tax_rate = col('income_tax') / col('pretax_income')
+
+        has_debt = total_long_term_debt > 0
+        _set_status(status, has_debt & ~has('interest_expense'), STATUS_MISSING_INTEREST_EXPENSE)
+        cost_of_debt_after_tax = np.where(has_debt, col('interest_expense') / total_long_term_debt
+                                          * (1 - effective_tax_rate), 0)
+
+        # cost of equity
+        _set_status(status, np.isnan(beta), STATUS_MISSING_BETA)
+        cost_of_equity = rf_rate + beta * erp
+
+        shares_outstanding = np.nan_to_num(if_none('com_shares_outstanding', 0), nan=0) + \
+            np.nan_to_num(if_none('pref_shares_outstanding', 0), nan=0)
+        _set_status(status, np.isnan(share_price), STATUS_MISSING_SHARE_PRICE)
+        _set_status(status, shares_outstanding == 0, STATUS_ZERO_SHARES)
+
+        # weighted average cost of capital
+        market_cap = share_price * shares_outstanding
+        total = total_long_term_debt + market_cap
+        wacc_rate = (total_long_term_debt / total) * cost_of_debt_after_tax + (market_cap / total) * cost_of_equity
+
+        # free cash flow to firm
+        _set_status(status, ~has('operating_income'), STATUS_MISSING_OPERATING_INCOME)
+        after_tax_operating_income = col('operating_income') * (1 - effective_tax_rate)
+
+        _set_status(status, ~(has('net_cash_operating') & has('net_income')), STATUS_MISSING_CASH_FLOW_INPUTS)
+        reinvestment = col('net_cash_operating') - col('net_income') - if_none('share_based_compensation', 0) \
+            - if_none('capex', 0)
+        fcff = after_tax_operating_income + reinvestment
+
+        years = np.arange(1, N_PROJECTION_YEARS + 1)
+        fcff_projection = fcff[:, None] * (1 + np.asarray(growth_rate, dtype=float))[..., None] ** years
+
+        equity_val_residual = if_none('cash_and_equivalents', 0) - (if_none('current_debt', 0) + total_long_term_debt)
+
+    return {
+        'status': status,
+        'wacc_rate': wacc_rate,
+        'fcff_projection': fcff_projection,
+        'equity_val_residual': equity_val_residual,
+        'shares_outstanding': shares_outstanding,
+    }
+
+
+@profiling.timed('batch.dcf')
+def calc_intrinsic_values(perp_growth_rate, dcf_inputs):
+    """Vectorized modelling.calc_multiplier_to_intrinsic_value. Rows with non-zero status are set to NaN."""
+    wacc_rate = dcf_inputs['wacc_rate']
+    fcff_projection = dcf_inputs['fcff_projection'].copy()
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # add terminal value to the last projected year
+        multiplier = (1 + perp_growth_rate) / (wacc_rate - perp_growth_rate)
+        fcff_projection[:, -1] = fcff_projection[:, -1] * (1 + multiplier)
+
+        # discount projected cash flows (equivalent to npf.npv with zero cash flow at period 0)
+        discount = (1 + wacc_rate)[:, None] ** np.arange(1, N_PROJECTION_YEARS + 1)
+        enterprise_value = (fcff_projection / discount).sum(axis=1)
+        intrinsic_value = (enterprise_value + dcf_inputs['equity_val_residual']) / dcf_inputs['shares_outstanding']
+
+    return np.where(dcf_inputs['status'] == STATUS_OK, intrinsic_value, np.nan)
+
+
+@profiling.timed('batch.optimizer')
+def solve_implied_perp_g_rates(share_price, dcf_inputs):
+    """Vectorized modelling.calc_implied_perp_growth_rate.
+    Returns implied perpetual growth rates and mask of rows with a valid root in (-1, wacc), other rows are NaN.
+    """
+    wacc_rate = dcf_inputs['wacc_rate']
+    fcff_projection = dcf_inputs['fcff_projection']
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        discount = (1 + wacc_rate)[:, None] ** np.arange(1, N_PROJECTION_YEARS + 1)
+        pv_projection = (fcff_projection / discount).sum(axis=1)
+        pv_last = fcff_projection[:, -1] / discount[:, -1]
+
+        # (1 + g) / (wacc - g) = k  =>  g = (k * wacc - 1) / (1 + k)
+        k = (np.asarray(share_price, dtype=float) * dcf_inputs['shares_outstanding']
+             - dcf_inputs['equity_val_residual'] - pv_projection) / pv_last
+        perp_growth_rate = (k * wacc_rate - 1) / (1 + k)
+
+        valid = (dcf_inputs['status'] == STATUS_OK) & np.isfinite(perp_growth_rate) & \
+            (perp_growth_rate > -1) & (perp_growth_rate < wacc_rate)
+
+    if profiling.ENABLED:
+        solved = dcf_inputs['status'] == STATUS_OK
+        profiling.count('optimizer.solves', int(solved.sum()))
+        profiling.count('optimizer.no_root', int((solved & ~valid).sum()))
+    return np.where(valid, perp_growth_rate, np.nan), valid
+
+
+def get_intrinsic_values(values, mask, share_price, beta, erp, rf_rate, growth_rate, perp_growth_rate):
+    """Calculates intrinsic values for all rows. Returns arrays of intrinsic values and status codes."""
+    dcf_inputs = calc_dcf_inputs(values, mask, share_price, beta, erp, rf_rate, growth_rate)
+    return calc_intrinsic_values(np.asarray(perp_growth_rate, dtype=float), dcf_inputs), dcf_inputs['status']
+
+
+def get_status_messages(status):
+    """Maps status codes to error messages."""
+    return [STATUS_MESSAGES[code] for code in status]
+
+
+@profiling.timed('batch.inputs')
+def get_batch_inputs(tickers=None, fund=None, with_perp_growth_rate=True):
+    """Collects fundamentals, share prices, betas and macro rates for all (ticker, date) rows of tickers.
+    Rows are limited to const.YEARS. Uses the saved fundamentals matrix unless fund is given.
+    """
+    fund = fundamentals.load_fundamentals() if fund is None else fund
+    rows = fund.get_rows(tickers)
+    rows = rows[np.isin(fund.index['year'].to_numpy()[rows], const.YEARS)]
+    index = fund.index.iloc[rows].reset_index(drop=True)
+
+    beta_map = da.get_betas()
+    macro = fd.get_macro_at_dates(index['date'])
+
+    inputs = {
+        'ticker': index['ticker'].to_numpy(),
+        'date': index['date'].to_numpy(),
+        'values': np.asarray(fund.values[rows]),
+        'mask': np.asarray(fund.mask[rows]),
+        'share_price': da.get_share_prices_around_dates(index, offsets=[0], date_col='date')['share_price_0d']
+        .to_numpy(),
+        'beta': np.array([beta_map.get(t, np.nan) for t in index['ticker']], dtype=float),
+        'erp': macro['erp'].to_numpy(),
+        'rf_rate': macro['rf_rate'].to_numpy(),
+        'growth_rate': macro['growth_rate'].to_numpy(),
+    }
+    if with_perp_growth_rate:
+        inputs['perp_growth_rate'] = np.array([model.get_perp_growth_rate(t, d, create_lag=True)
+                                               for t, d in zip(index['ticker'], index['date'])], dtype=float)
+
+    # fingerprints of the same inputs as in the scalar path (see algo.fingerprints)
+    fingerprint_inputs = index[['ticker', 'date']].assign(
+        statement_hash=[fingerprints.get_statement_hash(t, y) for t, y in zip(index['ticker'], index['year'])],
+        share_price=inputs['share_price'], beta=inputs['beta'], rf_rate=inputs['rf_rate'], erp=inputs['erp'],
+        growth_rate=inputs['growth_rate'], perp_growth_rate=inputs.get('perp_growth_rate', np.nan))
+    inputs['input_fingerprint'] = fingerprints.get_input_fingerprints(fingerprint_inputs)
+
+    return inputs
+
+
+def drop_unchanged_rows(inputs, stored_fingerprints=None):
+    """Drops rows of batch inputs whose input fingerprint equals stored_fingerprints[(ticker, date)].
+    Returns the remaining inputs and the number of dropped rows.
+    """
+    if not stored_fingerprints:
+        return inputs, 0
+    unchanged = np.array([stored_fingerprints.get((ticker, date)) == fingerprint for ticker, date, fingerprint
+                          in zip(inputs['ticker'], inputs['date'], inputs['input_fingerprint'])], dtype=bool)
+    return {key: val[~unchanged] for key, val in inputs.items()}, int(unchanged.sum())
+
+
+def run_intrinsic_values(tickers=None, fund=None, stored_fingerprints=None):
+    """Calculates intrinsic values for all rows of tickers, except rows with unchanged inputs (see drop_unchanged_rows).
+    Returns dataframe with the same columns as modelling.get_intrinsic_value_wrapper results and the number of
+    skipped rows.
+    """
+    inputs, n_skipped = drop_unchanged_rows(get_batch_inputs(tickers, fund), stored_fingerprints)
+    intrinsic_value, status = get_intrinsic_values(inputs['values'], inputs['mask'], inputs['share_price'],
+                                                   inputs['beta'], inputs['erp'], inputs['rf_rate'],
+                                                   inputs['growth_rate'], inputs['perp_growth_rate'])
+
+    return pd.DataFrame({
+        'ticker': inputs['ticker'],
+        'date': inputs['date'],
+        'intrinsic_value': intrinsic_value,
+        'share_price': inputs['share_price'],
+        'error_message': get_status_messages(status),
+        'input_fingerprint': inputs['input_fingerprint'],
+    }), n_skipped
+
+
+def run_implied_perp_g_rates(tickers=None, fund=None, stored_fingerprints=None):
+    """Solves implied perpetual growth rates for all rows of tickers, except rows with unchanged inputs
+    (see drop_unchanged_rows).
+    Returns dataframe with the same columns as modelling.get_optimized_perp_g_rate results and the number of skipped
+    rows. Rows without root are NaN, so that their input fingerprints are stored as well.
+    """
+    inputs = get_batch_inputs(tickers, fund, with_perp_growth_rate=False)
+    inputs, n_skipped = drop_unchanged_rows(inputs, stored_fingerprints)
+    dcf_inputs = calc_dcf_inputs(inputs['values'], inputs['mask'], inputs['share_price'], inputs['beta'],
+                                 inputs['erp'], inputs['rf_rate'], inputs['growth_rate'])
+    implied_perp_g_rate, _ = solve_implied_perp_g_rates(inputs['share_price'], dcf_inputs)
+
+    return pd.DataFrame({
+        'ticker': inputs['ticker'],
+        'date': inputs['date'],
+        'implied_perp_g_rate': implied_perp_g_rate,
+        'input_fingerprint': inputs['input_fingerprint'],
+    }), n_skipped
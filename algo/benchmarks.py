@@ -0,0 +1,198 @@
+"""
+This module contains benchmarks of the valuation and SEC data processing hot paths, run on synthetic data
+(see algo.synthetic_data and algo/scripts/benchmark_script.py).
+Each benchmark is timed several times and the fastest run is reported. In-memory caches are cleared before each run,
+binary share prices, the statements dataset and the fundamentals matrix are prepared once.
+Results are compared with baselines tracked in const.PATH_BENCHMARK_BASELINES.
+"""
+
+import json
+import os
+import time
+import algo.batch_modelling as batch
+import algo.constants as const
+import algo.data_acquisition as da
+import algo.downloader as downloader
+import algo.fetched_data as fd
+import algo.fundamentals as fundamentals
+import algo.modelling as model
+import algo.price_store as price_store
+import algo.runner as runner
+import algo.sec_companyfacts as sec_companyfacts
+import algo.sec_processing as sec_processing
+from algo.stub_server import StubServer
+
+# registry of benchmarks, name -> function of the list of tickers
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Registers decorated function as benchmark."""
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def get_ticker_years(tickers):
+    return [(ticker, year) for ticker in tickers
+            for year in sorted({int(date[:4]) for date in da.get_ticker_dates(ticker)})]
+
+
+def get_ticker_dates(tickers):
+    return [(ticker, date) for ticker in tickers for date in da.get_ticker_dates(ticker)]
+
+
+@benchmark('get_single_observation')
+def bench_get_single_observation(tickers):
+    concepts = [concept for chain in const.FUNDAMENTAL_CONCEPTS.values() for concept in chain]
+    for ticker, year in get_ticker_years(tickers):
+        for concept in concepts:
+            da.get_single_observation(ticker, concept, year)
+
+
+@benchmark('get_intrinsic_value')
+def bench_get_intrinsic_value(tickers):
+    for ticker, date in get_ticker_dates(tickers):
+        # missing statement values raise TypeError, handled the same way in the valuation run
+        try:
+            model.get_intrinsic_value(ticker, date)
+        except TypeError:
+            pass
+
+
+@benchmark('implied_perp_g_rate')
+def bench_implied_perp_g_rate(tickers):
+    for ticker, date in get_ticker_dates(tickers):
+        try:
+            model.get_intrinsic_value(ticker, date, optimize_perp_g_rate=True)
+        except TypeError:
+            pass
+
+
+@benchmark('implied_perp_g_rate_batch')
+def bench_implied_perp_g_rate_batch(tickers):
+    batch.run_implied_perp_g_rates(tickers)
+
+
+@benchmark('main')
+def bench_main(tickers):
+    runner.run_valuation(tickers, n_workers=1, recompute_all=True)
+
+
+@benchmark('main_batch')
+def bench_main_batch(tickers):
+    runner.run_valuation(tickers, use_batch_engine=True, n_workers=1, recompute_all=True)
+
+
+@benchmark('sec_processing_part1')
+def bench_sec_processing_part1(tickers):
+    sec_companies, cik_sp500 = sec_processing.load_universe()
+    sec_processing.extract_quarters(const.YEARS_QUARTERS, sec_companies, cik_sp500)
+
+
+@benchmark('sec_processing_part2')
+def bench_sec_processing_part2(tickers):
+    sec_processing.build_statements()
+
+
+@benchmark('sec_companyfacts')
+def bench_sec_companyfacts(tickers):
+    sec_companyfacts.read_companyfacts()
+
+
+@benchmark('download_betas')
+def bench_download_betas(tickers):
+    # quote pages with the current betas served by a local stub server with latency and one failure per page
+    betas = da.get_betas()
+    routes = {f'/quote/{ticker}': f'<table><tr><td>Price</td><td>1</td></tr></table>'
+                                  f'<table><tr><td>Beta (5Y Monthly)</td><td>{betas[ticker]}</td></tr></table>'
+              for ticker in tickers}
+    engine = downloader.Downloader(rate=None, default_host_limit=4, backoff=0.01)
+    # the stub server is local, so replay-only mode of offline runs does not apply, pages are not cached
+    with StubServer(routes, latency=0.05, n_failures=1) as server:
+        da.download_all_betas(tickers, base_url=server.url, ttl=None, engine=engine, replay=False)
+
+
+def clear_caches():
+    """Clears all in-memory caches, so that each run starts from data on disk."""
+    da.statement_cache.clear()
+    da.price_store.clear()
+    for func in fd.LAZY_DATASETS.values():
+        func.cache_clear()
+    fd.get_macro_calendar.cache_clear()
+    return None
+
+
+def prepare(tickers):
+    """Prepares derived data (binary share prices, statements dataset, fundamentals matrix and SEC Part 1 output)."""
+    price_store.build_price_store(tickers)
+    da.convert_statements_csv_to_dataset()
+    fundamentals.build_fundamentals()
+    bench_sec_processing_part1(tickers)
+    clear_caches()
+    return None
+
+
+def run_benchmark(name, tickers, repeat=3):
+    """Returns the fastest of repeat runs of benchmark in seconds."""
+    timings = []
+    for _ in range(repeat):
+        clear_caches()
+        start = time.perf_counter()
+        BENCHMARKS[name](tickers)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run_benchmarks(tickers, names=None, repeat=3):
+    """Runs benchmarks (all by default), returns dictionary mapping benchmark names to seconds."""
+    names = list(BENCHMARKS) if names is None else names
+    results = {}
+    for name in names:
+        results[name] = run_benchmark(name, tickers, repeat)
+        print(f'{name}: {results[name]:.3f} s')
+    return results
+
+
+def load_baselines(path=const.PATH_BENCHMARK_BASELINES):
+    if not os.path.exists(path):
+        return {'scale': {}, 'benchmarks': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baselines(results, scale, path=const.PATH_BENCHMARK_BASELINES):
+    """Saves results as new baselines, keeping baselines of benchmarks which were not run."""
+    baselines = load_baselines(path)
+    if baselines['scale'] != scale:
+        baselines = {'scale': scale, 'benchmarks': {}}
+    baselines['benchmarks'].update({name: round(seconds, 4) for name, seconds in results.items()})
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write('\n')
+    return None
+
+
+def compare_with_baselines(results, scale, tolerance=0.2, path=const.PATH_BENCHMARK_BASELINES):
+    """Prints ratio of results to baselines. Returns names of benchmarks slower than baseline by more than tolerance.
+    Baselines recorded at a different scale of synthetic data are not compared.
+    """
+    baselines = load_baselines(path)
+    if baselines['scale'] != scale:
+        print(f'baselines were recorded at scale {baselines["scale"]}, not compared')
+        return []
+
+    regressions = []
+    for name, seconds in results.items():
+        baseline = baselines['benchmarks'].get(name)
+        if baseline is None:
+            print(f'{name}: no baseline')
+            continue
+        ratio = seconds / baseline
+        print(f'{name}: {seconds:.3f} s, baseline {baseline:.3f} s, ratio {ratio:.2f}')
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+    return regressions
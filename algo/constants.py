@@ -6,6 +6,36 @@ SEC_HEADERS = {'User-Agent': SEC_USER_AGENT}
 REQUESTS_HEADERS = {'User-agent': 'Mozilla/5.0'}
 YFINANCE_HEADERS = {'User-agent': 'Mozilla/5.0'}
 
+# offline mode, network is never accessed (e.g. on air-gapped batch nodes)
+OFFLINE = os.environ.get('ALGO_OFFLINE', '0') == '1'
+
+# base urls of scraped pages and APIs, can be pointed to a local stub server (see algo.stub_server)
+URL_YAHOO = os.environ.get('ALGO_URL_YAHOO', 'https://finance.yahoo.com')
+URL_SEC_DATA = os.environ.get('ALGO_URL_SEC_DATA', 'https://data.sec.gov')
+URL_SEC_WWW = os.environ.get('ALGO_URL_SEC_WWW', 'https://www.sec.gov')
+
+URL_SEC_COMPANIES = f'{URL_SEC_WWW}/files/company_tickers.json'
+SEC_COMPANIES_TTL_DAYS = 7
+
+# host of price histories downloaded by yfinance
+HOST_YAHOO_PRICES = 'query2.finance.yahoo.com'
+
+# concurrent downloads (see algo.downloader), rate limit is shared by all hosts
+DOWNLOAD_WORKERS = 8
+DOWNLOAD_RATE_PER_SECOND = 5.0
+DOWNLOAD_HOST_LIMITS = {'finance.yahoo.com': 4, HOST_YAHOO_PRICES: 4, 'data.sec.gov': 4}
+DOWNLOAD_DEFAULT_HOST_LIMIT = 2
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_BACKOFF_SECONDS = 1.0
+DOWNLOAD_TIMEOUT_SECONDS = 30
+
+# shared HTTP sessions and on-disk cache of responses (see algo.http_client)
+FLD_HTTP_CACHE = 'data/http_cache'
+HTTP_CACHE_TTL_SECONDS = 24 * 60 * 60
+HTTP_POOL_SIZE = 16
+# replay-only mode, responses are served from the cache only, implied by offline mode
+HTTP_REPLAY = os.environ.get('ALGO_HTTP_REPLAY', '0') == '1' or OFFLINE
+
 YEARS = list(range(2009, 2024))
 # YEARS = list(range(2020, 2023))
 QUARTERS = ['q1', 'q2', 'q3', 'q4']
@@ -13,16 +43,77 @@ YEARS_QUARTERS = [f'{year}{quarter}' for year in YEARS for quarter in QUARTERS]
 
 N_MIN_STATEMENT_RECORDS = 100
 
+# memory budget of the in-memory statement cache (whole tickers are evicted above it)
+STATEMENT_CACHE_MAX_BYTES = 512 * 1024 ** 2
+
 # assumptions
 PERP_GROWTH_RATE = 0.04
 GROWTH_RATE = 0.1
 
 FETCH_MIN_YEAR = 2008
 
+# version of the valuation logic, bump it to recompute all stored results (see algo.fingerprints)
+MODEL_VERSION = 1
+
+# profiling of valuation runs, enabled by environment variable (see algo.profiling)
+PROFILE = os.environ.get('ALGO_PROFILE', '0') == '1'
+
+# parallel valuation runs
+N_WORKERS = os.cpu_count()
+N_SHARDS_PER_WORKER = 4
+
+# XBRL concepts used by the intrinsic value model
+# each item is resolved by the first concept with an available observation
+FUNDAMENTAL_CONCEPTS = {
+    'interest_expense': ['InterestExpense', 'InterestIncomeExpenseNonoperatingNet'],
+    'income_tax': ['IncomeTaxExpenseBenefit'],
+    'pretax_income': ['IncomeLossFromContinuingOperationsBeforeIncomeTaxesMinority' +
+                      'InterestAndIncomeLossFromEquityMethodInvestments',
+                      'IncomeLossFromContinuingOperationsBeforeIncomeTaxesExtraordinary' +
+                      'ItemsNoncontrollingInterest'],
+    'long_term_debt': ['LongTermDebtNoncurrent'],
+    'long_term_lease': ['CapitalLeaseObligationsNoncurrent'],
+    'com_shares_outstanding': ['CommonStockSharesOutstanding'],
+    'pref_shares_outstanding': ['PreferredStockSharesOutstanding'],
+    'operating_income': ['OperatingIncomeLoss'],
+    'net_cash_operating': ['NetCashProvidedByUsedInOperatingActivities',
+                           'NetCashProvidedByUsedInOperatingActivitiesContinuingOperations'],
+    'net_income': ['NetIncomeLoss', 'ProfitLoss'],
+    'share_based_compensation': ['ShareBasedCompensation'],
+    'capex': ['PaymentsToAcquirePropertyPlantAndEquipment'],
+    'cash_and_equivalents': ['CashAndCashEquivalentsAtCarryingValue'],
+    'current_debt': ['CurrentDebt'],
+}
+MODEL_CONCEPTS = sorted({concept for chain in FUNDAMENTAL_CONCEPTS.values() for concept in chain})
+
+# concept sets kept by the SEC ingest (see algo.sec_processing), None keeps all concepts (e.g. for exploration)
+INGEST_CONCEPT_SETS = {
+    'model': MODEL_CONCEPTS,
+    'full': None,
+}
+INGEST_CONCEPT_SET = 'model'
+
 # folders
 FLD_STATEMENTS_RAW = 'data/sec_statements_raw'
-FLD_STATEMENTS_PROCES = 'data/sec_statements_proces'
+FLD_STATEMENTS_QUARTERS = 'data/sec_statements_quarters'
+FLD_STATEMENTS_QUARTER_KEYS = 'data/sec_statements_quarter_keys'
+FLD_ACCEPTED_DATES_QUARTERS = 'data/accepted_dates_quarters'
+# manifest of ingested quarters with checksums of their raw files, only new or changed quarters are re-ingested
+PATH_STATEMENTS_MANIFEST = 'data/sec_statements_manifest.json'
+# XBRL company facts, bulk bundle of all companies or per-company files (see algo.sec_companyfacts)
+URL_SEC_COMPANYFACTS_BULK = f'{URL_SEC_WWW}/Archives/edgar/daily-index/xbrl/companyfacts.zip'
+FLD_COMPANYFACTS = 'data/sec_companyfacts'
+PATH_COMPANYFACTS_BUNDLE = os.path.join(FLD_COMPANYFACTS, 'companyfacts.zip')
+# extracted quarters are partitioned into buckets of tickers, Part 2 processes one bucket at a time
+N_STATEMENT_BUCKETS = 16
 FLD_STATEMENTS = 'data/sec_statements'
+FLD_STATEMENTS_DATASET = 'data/sec_statements_parquet'
+FLD_FUNDAMENTALS = 'data/fundamentals'
+STATEMENTS_ROW_GROUP_SIZE = 128 * 1024
+
+FLD_RESULTS = 'data/results'
+FILE_RESULTS_DB = 'results.sqlite'
+PATH_RESULTS_DB = os.path.join(FLD_RESULTS, FILE_RESULTS_DB)
 
 FLD_RESULTS_INTRINSIC_VALUES = 'data/results/intrinsic_values'
 FILE_RESULTS_INTRINSIC_VALUES = 'intrinsic_values.csv'
@@ -36,6 +127,12 @@ PATH_IMPLIED_PERP_G_RATES_P50 = os.path.join(FLD_IMPLIED_PERP_G_RATES, FILE_IMPL
 
 FLD_SHARE_PRICES = 'data/share_prices'
 FILE_SHARE_PRICES = 'share_prices.csv'
+FLD_SHARE_PRICES_BIN = 'data/share_prices_bin'
+# share price histories are refreshed incrementally, the last days of the stored history are downloaded again and
+# compared, changed closes (split or dividend adjustment) or a new split trigger full reload of SHARE_PRICE_PERIOD
+SHARE_PRICE_PERIOD = '30y'
+SHARE_PRICE_OVERLAP_DAYS = 10
+SHARE_PRICE_ADJUSTMENT_RTOL = 1e-5
 
 FLD_BETAS = 'data/betas'
 FILE_BETAS = 'betas.csv'
@@ -54,6 +151,21 @@ FLD_ERP = 'data/equity_risk_premium'
 FILE_ERP = 'equity_risk_premium.csv'
 PATH_ERP = os.path.join(FLD_ERP, FILE_ERP)
 
+FLD_SEC_COMPANIES = 'data/sec_companies'
+FILE_SEC_COMPANIES = 'company_tickers.json'
+PATH_SEC_COMPANIES = os.path.join(FLD_SEC_COMPANIES, FILE_SEC_COMPANIES)
+
+FLD_SP500_LIST = 'data/sp500_list'
+FILE_SP500_LIST = 'sp500_list.csv'
+PATH_SP500_LIST = os.path.join(FLD_SP500_LIST, FILE_SP500_LIST)
+
+FLD_PROFILING = 'data/profiling'
+FILE_PROFILE_REPORT = 'profile_report.json'
+PATH_PROFILE_REPORT = os.path.join(FLD_PROFILING, FILE_PROFILE_REPORT)
+
+# benchmarks (see algo.benchmarks), path relative to the repository root
+PATH_BENCHMARK_BASELINES = 'benchmarks/baselines.json'
+
 FLD_ACCEPTED_DATES = 'data/accepted_dates'
 FILE_ACCEPTED_DATES = 'accepted_dates.csv'
 PATH_ACCEPTED_DATES = os.path.join(FLD_ACCEPTED_DATES, FILE_ACCEPTED_DATES)
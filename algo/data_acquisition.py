@@ -1,20 +1,35 @@
 import ntpath
 import glob
 import os
+import shutil
 from io import StringIO
 import requests
 import datetime as dt
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
 import yahoo_fin.stock_info as si
 import algo.constants as const
 import algo.utils as utils
 import yfinance as yf
-from algo.fetched_data import sec_companies
+from yfinance.exceptions import YFRateLimitError
+import algo.downloader as downloader
+import algo.fetched_data as fd
+import algo.http_client as http_client
+import algo.profiling as profiling
+from algo.statement_cache import StatementCache
+from algo.price_store import PriceStore
 
 
 def get_sp500_list():
-    """Gets the list of S&P 500 companies"""
+    """Gets the list of S&P 500 companies and saves it as snapshot csv file.
+    In offline mode the last snapshot is used.
+    """
+    if const.OFFLINE:
+        current_stocks = pd.read_csv(const.PATH_SP500_LIST)
+        current_stocks['date_added'] = pd.to_datetime(current_stocks['date_added'])
+        return current_stocks
 
     url = 'https://en.wikipedia.org/wiki/List_of_S%26P_500_companies'
     data = pd.read_html(url)
@@ -23,6 +38,9 @@ def get_sp500_list():
     current_stocks.columns = ['ticker', 'date_added']
     current_stocks['date_added'] = pd.to_datetime(current_stocks['date_added'])
 
+    utils.maybe_make_dir(const.FLD_SP500_LIST)
+    utils.write_csv_atomic(current_stocks, const.PATH_SP500_LIST)
+
     return current_stocks
 
 
@@ -80,12 +98,11 @@ def get_sp500_history():
     return tickers_all
 
 
-def get_analysts_info(ticker, headers=const.YFINANCE_HEADERS):
+def get_analysts_info(ticker, headers=const.YFINANCE_HEADERS, base_url=const.URL_YAHOO):
     """Scrapes the Analysts page from Yahoo Finance for an input ticker."""
 
-    analysts_site = "https://finance.yahoo.com/quote/" + ticker + \
-                    "/analysts?p=" + ticker
-    tables = pd.read_html(StringIO(requests.get(analysts_site, headers=headers).text))
+    analysts_site = f'{base_url}/quote/{ticker}/analysts?p={ticker}'
+    tables = pd.read_html(StringIO(http_client.get(analysts_site, headers=headers).text))
     table_names = [table.columns[0] for table in tables]
     table_mapper = {key: val for key, val in zip(table_names, tables)}
     return table_mapper
@@ -117,10 +134,11 @@ def get_concept_by_ticker(ticker, concept, headers=const.SEC_HEADERS):
     """Downloads data from SEC for ticker and concept
     Not used - data are retrieved from .csv archive files
     """
+    sec_companies = fd.get_sec_companies()
     cik = sec_companies.loc[sec_companies['ticker'] == ticker, 'cik_str'].to_list()[0]
     try:
-        concept_response = requests.get(f'https://data.sec.gov/api/xbrl/companyconcept/CIK{cik}/us-gaap/{concept}.json',
-                                        headers=headers)
+        concept_response = http_client.get(
+            f'{const.URL_SEC_DATA}/api/xbrl/companyconcept/CIK{cik}/us-gaap/{concept}.json', headers=headers)
         return pd.DataFrame.from_dict(concept_response.json()['units']['USD'])
     except requests.exceptions.JSONDecodeError:
         return None
@@ -150,21 +168,29 @@ def get_single_observation_api(ticker, concept, year, return_value=True):
 
 
 def get_single_observation(ticker, concept, year, return_value=True):
-    """Gets a single observation for ticker, concept and year. Uses csv data.
+    """Gets a single observation for ticker, concept and year. Uses cached statement data.
     Parameter return_value is kept for backward compatibility with get_single_observation_api
     """
-    data_raw = pd.read_csv(f'{const.FLD_STATEMENTS}/{ticker}.csv')
-    data_raw['year'] = pd.to_datetime(data_raw['date']).dt.year
-    res = data_raw.loc[(data_raw['ticker'] == ticker) &
-                       (data_raw['concept'] == concept) &
-                       (data_raw['year'] == year), 'val']
+    res = statement_cache.get(ticker).get_values(concept, year)
 
     if res.shape[0] == 0:
         return None
     elif res.shape[0] > 1:
         raise ValueError(f'Multiple observations for {ticker} and {concept} in year {year}')
     else:
-        return res.values[0]
+        return res[0]
+
+
+@profiling.timed('valuation.statements')
+def get_fundamental(ticker, item, year):
+    """Gets a model input defined in const.FUNDAMENTAL_CONCEPTS for ticker and year.
+    Concepts of the item are tried in order and the first available observation is returned.
+    """
+    for concept in const.FUNDAMENTAL_CONCEPTS[item]:
+        res = get_single_observation(ticker, concept, year)
+        if res is not None:
+            return res
+    return None
 
 
 def get_single_observation_non_usd(ticker, concept, year, return_value=True, units='shares'):
@@ -173,10 +199,11 @@ def get_single_observation_non_usd(ticker, concept, year, return_value=True, uni
     On the other hand the most recent data might not be available in the archive (? check)
     """
     headers = {'User-Agent': const.SEC_USER_AGENT}
+    sec_companies = fd.get_sec_companies()
     cik = sec_companies.loc[sec_companies['ticker'] == ticker, 'cik_str'].to_list()[0]
     try:
-        concept_response = requests.get(f'https://data.sec.gov/api/xbrl/companyconcept/CIK{cik}/us-gaap/{concept}.json',
-                                        headers=headers)
+        concept_response = http_client.get(
+            f'{const.URL_SEC_DATA}/api/xbrl/companyconcept/CIK{cik}/us-gaap/{concept}.json', headers=headers)
         df = pd.DataFrame.from_dict(concept_response.json()['units'][units])
     except requests.exceptions.JSONDecodeError:
         return None
@@ -196,11 +223,15 @@ def get_single_observation_non_usd(ticker, concept, year, return_value=True, uni
         return res
 
 
-def download_ticker_beta(ticker, headers=const.YFINANCE_HEADERS):
-    """Gets the beta for a given ticker"""
-    site = "https://finance.yahoo.com/quote/" + ticker + "?p=" + ticker
+def download_ticker_beta(ticker, headers=const.YFINANCE_HEADERS, base_url=const.URL_YAHOO,
+                         ttl=const.HTTP_CACHE_TTL_SECONDS, replay=None, slot=None):
+    """Gets the beta for a given ticker (the quote page is cached for ttl seconds, see algo.http_client.get for replay
+    and slot)"""
+    site = f'{base_url}/quote/{ticker}?p={ticker}'
     # price_data = pd.read_html(StringIO(requests.get(site, headers=headers).text))[0]
-    response = pd.read_html(StringIO(requests.get(site, headers=headers).text))
+    response = http_client.get(site, headers=headers, ttl=ttl, replay=replay, slot=slot)
+    downloader.raise_for_status(response)
+    response = pd.read_html(StringIO(response.text))
     if len(response) < 2:
         return None
     else:
@@ -209,26 +240,39 @@ def download_ticker_beta(ticker, headers=const.YFINANCE_HEADERS):
     return float(beta)
 
 
-def download_all_betas(tickers_list, headers=const.YFINANCE_HEADERS):
-    """Downloads betas for a list of tickers."""
+def download_all_betas(tickers_list, headers=const.YFINANCE_HEADERS, base_url=const.URL_YAHOO,
+                       ttl=const.HTTP_CACHE_TTL_SECONDS, engine=None, replay=None):
+    """Downloads betas for a list of tickers concurrently (see algo.downloader), cached pages are not throttled.
+    Betas of failed tickers are kept as they are. Returns dictionary of errors of failed tickers.
+    """
     # tickers_list = available_tickers
-    downloads_list = []
-    for ticker in tickers_list:
-        print(ticker)
-        beta = download_ticker_beta(ticker, headers=headers)
-        downloads_list.append({'ticker': ticker, 'beta': beta})
-    downloads = pd.DataFrame(downloads_list)
+    engine = downloader.Downloader() if engine is None else engine
+    betas, errors = engine.run(tickers_list, downloader.get_host(base_url),
+                               lambda ticker: download_ticker_beta(ticker, headers=headers, base_url=base_url, ttl=ttl,
+                                                                   replay=replay, slot=engine.slot),
+                               throttle=False)
+    downloads = pd.DataFrame([{'ticker': ticker, 'beta': beta} for ticker, beta in betas.items()],
+                             columns=['ticker', 'beta'])
 
     utils.upsert_into_df(downloads, const.FLD_BETAS, const.FILE_BETAS, index_cols=['ticker'])
-    return None
+    return errors
 
 
+@profiling.timed('valuation.beta')
 def get_beta(ticker):
     """Gets the beta for a given ticker."""
+    profiling.count_file_read(f'{const.FLD_BETAS}/{const.FILE_BETAS}')
     betas = pd.read_csv(f'{const.FLD_BETAS}/{const.FILE_BETAS}')
     return betas.loc[betas['ticker'] == ticker, 'beta'].values[0]
 
 
+def get_betas():
+    """Gets dictionary of betas of all tickers."""
+    profiling.count_file_read(f'{const.FLD_BETAS}/{const.FILE_BETAS}')
+    betas = pd.read_csv(f'{const.FLD_BETAS}/{const.FILE_BETAS}').drop_duplicates(subset='ticker', keep='last')
+    return dict(zip(betas['ticker'], betas['beta']))
+
+
 def download_ticker_shares_outstanding(ticker, date):
     """Gets the number of shares outstanding for a given ticker and date.
     Not used - data are retrieved from .csv archive files
@@ -240,82 +284,68 @@ def download_ticker_shares_outstanding(ticker, date):
     return last_value
 
 
-def download_all_shares_outstanding(tickers_list):
-    """Downloads shares outstanding for a list of tickers.
-    Not used - data are retrieved from .csv archive files
+def download_ticker_shares_outstanding_history(ticker):
+    """Downloads history of shares outstanding of ticker from Yahoo Finance and writes it atomically.
+    Returns number of rows, None if there are no data.
     """
-    # tickers_list = get_available_tickers()
-    for idx, ticker in enumerate(tickers_list):
+    try:
+        history = yf.Ticker(ticker).get_shares_full().sort_index()
+        history = history.reset_index(drop=False)
+        history.columns = ['Date', 'Shares_Outstanding']
+        history['Date'] = history['Date'].dt.date
+    except AttributeError:
+        print(f'{ticker} no data')
+        return None
 
-        # retrieve share price history from Yahoo Finance
-        yf_ticker = yf.Ticker(ticker)
-        try:
-            history = yf_ticker.get_shares_full().sort_index()
-            history = history.reset_index(drop=False)
-            history.columns = ['Date', 'Shares_Outstanding']
-            history['Date'] = history['Date'].dt.date
-        except AttributeError:
-            print(f'{ticker} no data')
-            continue
+    # write to csv
+    utils.maybe_make_dir(const.FLD_SHARES_OUTSTANDING)
+    utils.write_csv_atomic(history, f'{const.FLD_SHARES_OUTSTANDING}/{ticker}.csv')
+    return history.shape[0]
 
-        # write to csv
-        utils.maybe_make_dir(const.FLD_SHARES_OUTSTANDING)
-        history.to_csv(f'{const.FLD_SHARES_OUTSTANDING}/{ticker}.csv', index=False)
-        print(f'{ticker} ok')
 
-    return None
+def download_all_shares_outstanding(tickers_list, engine=None):
+    """Downloads shares outstanding for a list of tickers concurrently (see algo.downloader).
+    Not used - data are retrieved from .csv archive files
+    Returns dictionary of errors of failed tickers.
+    """
+    # tickers_list = get_available_tickers()
+    engine = get_yfinance_downloader() if engine is None else engine
+    _, errors = engine.run(tickers_list, const.HOST_YAHOO_PRICES, download_ticker_shares_outstanding_history)
+    return errors
 
 
+@profiling.timed('valuation.share_price')
 def get_share_price(ticker, date):
-    """Gets share price for a given ticker and date."""
-    # load history from csv
-    try:
-        history = pd.read_csv(f'{const.FLD_SHARE_PRICES}/{ticker}.csv')
-    except FileNotFoundError:
-        return np.nan
+    """Gets share price for a given ticker and date (the last close on or before the date)."""
+    return price_store.get_price(ticker, date, direction='before')
 
-    try:
-        closes_before_date = history.loc[history['Date'] <= date, 'Close']
-    except KeyError:
-        return np.nan
 
-    if closes_before_date.shape[0] == 0:
-        return np.nan
-    else:
-        return closes_before_date.iloc[-1]
+def get_share_price_around_date(ticker, date, direction='before', n_days=1):
+    """Gets share price for a given ticker and date shifted by n_days.
+    Returns the last close before or the first close after the shifted date, depending on direction.
+    """
+    return price_store.get_price(ticker, date, direction=direction, n_days=n_days)
 
 
-def get_share_price_around_date(ticker, date, direction='before', n_days=1):
-    """Gets share price for a given ticker and date."""
-    # shift date by n_days
-    date_shifted = pd.to_datetime(date) + pd.DateOffset(days=n_days)
+def get_share_prices_around_dates(df, offsets, ticker_col='ticker', date_col='accepted'):
+    """Batch version of get_share_price_around_date. Adds column share_price_{offset}d for each offset in offsets.
+    Positive offset n gets the first close on or after date + n days (direction 'after', n_days=n).
+    Negative offset -n gets the last close on or before date + n days (direction 'before', n_days=n).
+    All rows of a ticker are looked up at once in the price store.
+    """
+    res = df.copy()
+    dates = pd.to_datetime(res[date_col]).to_numpy(dtype='datetime64[ns]')
+    prices = {offset: np.full(res.shape[0], np.nan) for offset in offsets}
 
-    # load history from csv
-    try:
-        history = pd.read_csv(f'{const.FLD_SHARE_PRICES}/{ticker}.csv')
-        # convert date to datetime
-        history['Date'] = pd.to_datetime(history['Date'])
-    except (FileNotFoundError, KeyError) as e:
-        return np.nan
+    for ticker, idx in res.groupby(ticker_col).indices.items():
+        for offset in offsets:
+            direction = 'after' if offset > 0 else 'before'
+            prices[offset][idx] = price_store.get_prices(ticker, dates[idx], direction=direction, n_days=abs(offset))
 
-    try:
-        if direction == 'before':
-            closes_filtered = history.loc[history['Date'] <= date_shifted, 'Close']
-        elif direction == 'after':
-            closes_filtered = history.loc[history['Date'] >= date_shifted, 'Close']
-        else:
-            raise ValueError('direction must be either before or after')
-
-    except KeyError:
-        return np.nan
-
-    if closes_filtered.shape[0] == 0:
-        return np.nan
-    else:
-        if direction == 'before':
-            return closes_filtered.iloc[-1]
-        elif direction == 'after':
-            return closes_filtered.iloc[0]
+    for offset in offsets:
+        res[f'share_price_{offset}d'] = prices[offset]
+
+    return res
 
 
 def get_shares_outstanding_yf_data(ticker, date):
@@ -338,21 +368,21 @@ def get_growth_estimate(ticker):
 
 def get_ticker_dates(ticker, limit_to_defined_years=True):
     """Returns list of available dates for a given ticker."""
-    res = pd.read_csv(os.path.join(const.FLD_STATEMENTS, f'{ticker}.csv'))['date'] \
-        .drop_duplicates() \
-        .sort_values()\
-        .to_list()
+    res = statement_cache.get(ticker).dates
     # limit to years from constants module
     if limit_to_defined_years:
         res = [date for date in res if pd.to_datetime(date).year in const.YEARS]
 
-    return res
+    return list(res)
 
 
 def get_available_tickers(start_from=None):
     """Returns list of available tickers."""
-    all_files = glob.glob(os.path.join(const.FLD_STATEMENTS, "*.csv"))
-    tickers = [ntpath.basename(f).replace('.csv', '') for f in all_files]
+    if os.path.isdir(const.FLD_STATEMENTS_DATASET):
+        tickers = sorted(read_statements(columns=['ticker'])['ticker'].astype(str).unique())
+    else:
+        all_files = glob.glob(os.path.join(const.FLD_STATEMENTS, "*.csv"))
+        tickers = [ntpath.basename(f).replace('.csv', '') for f in all_files]
 
     # start from a specific ticker if required
     if start_from is not None:
@@ -362,71 +392,320 @@ def get_available_tickers(start_from=None):
     return tickers
 
 
-def download_all_share_prices(tickers_list):
-    # tickers_list = get_available_tickers()
-    """Downloads all share prices for available tickers."""
+STATEMENTS_SCHEMA = pa.schema([
+    ('adsh', pa.string()),
+    ('date', pa.date32()),
+    ('accepted', pa.timestamp('s')),
+    ('ticker', pa.dictionary(pa.int32(), pa.string())),
+    ('cik', pa.int64()),
+    ('concept', pa.dictionary(pa.int32(), pa.string())),
+    ('source_yq', pa.dictionary(pa.int32(), pa.string())),
+    ('val', pa.float64()),
+    ('year', pa.int32()),
+])
+
+
+def statements_to_table(df):
+    """Converts statements dataframe to arrow table with STATEMENTS_SCHEMA, sorted for row group pruning."""
+    df = df.sort_values(['ticker', 'concept', 'date'])
+    date = pd.to_datetime(df['date'])
+    arrays = {
+        'adsh': pa.array(df['adsh'].astype(str), type=pa.string()),
+        'date': pa.array(date.dt.date, type=pa.date32()),
+        'accepted': pa.array(pd.to_datetime(df['accepted']).dt.floor('s'), type=pa.timestamp('s')),
+        'ticker': pa.array(df['ticker'].astype(str)).dictionary_encode(),
+        'cik': pa.array(df['cik'], type=pa.int64()),
+        'concept': pa.array(df['concept'].astype(str)).dictionary_encode(),
+        'source_yq': pa.array(df['source_yq'].astype(str)).dictionary_encode(),
+        'val': pa.array(df['val'], type=pa.float64()),
+        'year': pa.array(date.dt.year, type=pa.int32()),
+    }
+    return pa.table(arrays, schema=STATEMENTS_SCHEMA)
+
+
+STATEMENTS_PARTITIONING = ds.partitioning(pa.schema([('year', pa.int32())]), flavor='hive')
+
+
+def write_statements(df, fld=const.FLD_STATEMENTS_DATASET):
+    """Writes statements into the parquet dataset partitioned by year.
+    Year partitions present in df are replaced, other partitions are kept.
+    """
+    ds.write_dataset(statements_to_table(df), fld, format='parquet', partitioning=STATEMENTS_PARTITIONING,
+                     existing_data_behavior='delete_matching',
+                     file_options=ds.ParquetFileFormat().make_write_options(compression='zstd'),
+                     max_rows_per_group=const.STATEMENTS_ROW_GROUP_SIZE)
+    return None
 
-    for idx, ticker in enumerate(tickers_list):
-        # retrieve share price history from Yahoo Finance
-        yf_ticker = yf.Ticker(ticker)
-        history = yf_ticker.history(period="30y").sort_index()
-        history = history.reset_index(drop=False)
-        try:
-            history['Date'] = history['Date'].dt.date
-        except AttributeError:
-            print(f'{ticker} no data')
-            continue
 
-        # write to csv
-        utils.maybe_make_dir(const.FLD_SHARE_PRICES)
-        history.to_csv(f'{const.FLD_SHARE_PRICES}/{ticker}.csv', index=False)
-        print(f'{ticker} ok')
+def replace_statement_years(df, years):
+    """Replaces year partitions years of the parquet dataset by statements df (years without rows in df are removed).
+    New partitions are written into a staging folder next to the dataset and swapped in by renames, old partitions
+    are deleted only once replaced, so that an interrupted write never loses statements.
+    """
+    fld_staging = f'{const.FLD_STATEMENTS_DATASET}.{os.getpid()}.staging'
+    shutil.rmtree(fld_staging, ignore_errors=True)
+    utils.maybe_make_dir(fld_staging)
+    if df.shape[0] > 0:
+        write_statements(df, fld_staging)
+
+    for year in years:
+        path = os.path.join(const.FLD_STATEMENTS_DATASET, f'year={year}')
+        path_new = os.path.join(fld_staging, f'year={year}')
+        path_old = os.path.join(fld_staging, f'old_year={year}')
+        if os.path.isdir(path):
+            os.replace(path, path_old)
+        if os.path.isdir(path_new):
+            os.replace(path_new, path)
+    shutil.rmtree(fld_staging)
     return None
 
 
-def download_sp500_returns():
-    """Downloads S&P 500 Y-O-Y returns for the last 30 years."""
-    sp500 = yf.Ticker('^GSPC')
-    history = sp500.history(period="30y").sort_index()
+def read_statement_years(years, tickers_excluded=()):
+    """Reads statements of years from the parquet dataset as written, except statements of tickers_excluded."""
+    existing = read_statements(years=years)
+    existing = existing.loc[~existing['ticker'].isin(tickers_excluded), :].drop(columns=['year'])
+    return existing.astype({col: str for col in ['ticker', 'concept', 'source_yq']})
+
+
+def merge_statements(df, tickers):
+    """Replaces statements of tickers in the parquet dataset by df, statements of other tickers are kept.
+    Only year partitions with old or new rows of tickers are rewritten (see replace_statement_years).
+    """
+    if not os.path.isdir(const.FLD_STATEMENTS_DATASET):
+        return write_statements(df)
+
+    years_old = read_statements(tickers=tickers, columns=['year'])['year']
+    years_new = pd.to_datetime(df['date']).dt.year
+    years = sorted(set(years_old) | set(years_new))
+    if len(years) == 0:
+        return None
+
+    existing = read_statement_years(years, tickers)
+    merged = pd.concat([existing, df], ignore_index=True) if existing.shape[0] > 0 else df
+    replace_statement_years(merged, years)
+    return None
+
+
+def append_statements(df):
+    """Adds statements df to the parquet dataset, all existing statements are kept.
+    Only year partitions with rows of df are rewritten (see replace_statement_years).
+    """
+    if not os.path.isdir(const.FLD_STATEMENTS_DATASET):
+        return write_statements(df)
+
+    years = sorted(set(pd.to_datetime(df['date']).dt.year))
+    if len(years) == 0:
+        return None
+
+    existing = read_statement_years(years)
+    merged = pd.concat([existing, df], ignore_index=True) if existing.shape[0] > 0 else df
+    replace_statement_years(merged, years)
+    return None
+
+
+def read_statements(tickers=None, concepts=None, years=None, columns=None):
+    """Reads statements from the parquet dataset.
+    Filters on tickers, concepts and years are pushed down to the dataset scan, columns limits loaded columns.
+    """
+    # explicit schema, so that a dataset left without partitions reads as empty
+    dataset = ds.dataset(const.FLD_STATEMENTS_DATASET, format='parquet', schema=STATEMENTS_SCHEMA,
+                         partitioning=STATEMENTS_PARTITIONING)
+
+    filters = []
+    if tickers is not None:
+        filters.append(ds.field('ticker').isin(list(tickers)))
+    if concepts is not None:
+        filters.append(ds.field('concept').isin(list(concepts)))
+    if years is not None:
+        filters.append(ds.field('year').isin(list(years)))
+
+    expression = None
+    for item in filters:
+        expression = item if expression is None else (expression & item)
+
+    if profiling.ENABLED:
+        for fragment in dataset.get_fragments(filter=expression):
+            profiling.count_file_read(fragment.path)
+
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+def convert_statements_csv_to_dataset():
+    """Converts per-ticker csv files in FLD_STATEMENTS into the parquet dataset."""
+    all_files = glob.glob(os.path.join(const.FLD_STATEMENTS, "*.csv"))
+    write_statements(pd.concat((pd.read_csv(f) for f in all_files), ignore_index=True))
+    return None
+
+
+@profiling.timed('io.load_statements')
+def load_ticker_statements(ticker):
+    """Loads statement data for a ticker. Uses parquet dataset if available, per-ticker csv file otherwise."""
+    if not os.path.isdir(const.FLD_STATEMENTS_DATASET):
+        profiling.count_file_read(f'{const.FLD_STATEMENTS}/{ticker}.csv')
+        return pd.read_csv(f'{const.FLD_STATEMENTS}/{ticker}.csv')
+
+    res = read_statements(tickers=[ticker], columns=['ticker', 'date', 'accepted', 'concept', 'val'])
+    if res.shape[0] == 0:
+        raise FileNotFoundError(f'No statements for {ticker}')
+
+    # keep the same value formats as in csv files
+    res['ticker'] = res['ticker'].astype(str)
+    res['concept'] = res['concept'].astype(str)
+    res['date'] = pd.to_datetime(res['date']).dt.strftime('%Y-%m-%d')
+    res['accepted'] = res['accepted'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    return res
+
+
+statement_cache = StatementCache(load_ticker_statements)
+price_store = PriceStore()
+
+
+def get_yfinance_downloader():
+    """Returns download engine which also retries rate limit errors raised by yfinance."""
+    return downloader.Downloader(retryable_errors=downloader.RETRYABLE_ERRORS + (YFRateLimitError,))
+
+
+def fetch_share_price_history(ticker, **kwargs):
+    """Downloads share price history of ticker from Yahoo Finance, kwargs (period or start) are passed to yfinance.
+    Returns None if there are no data.
+    """
+    # retrieve share price history from Yahoo Finance
+    yf_ticker = yf.Ticker(ticker)
+    history = yf_ticker.history(**kwargs).sort_index()
+    if history.shape[0] == 0:
+        return None
     history = history.reset_index(drop=False)
-    history['Date'] = history['Date'].dt.date
+    try:
+        history['Date'] = history['Date'].dt.date
+    except AttributeError:
+        return None
+    return history
+
+
+def needs_full_reload(stored, recent):
+    """Checks whether stored price history has to be reloaded, given recent history downloaded with overlap.
+    True if there is no overlap, closes on overlapping dates differ (adjusted for a split or dividend since the stored
+    download) or there is a new split. The last stored date is not compared, it may have been an intraday close.
+    """
+    last_date = stored['Date'].max()
+    overlap = stored.merge(recent, on='Date', suffixes=('', '_recent'))
+    overlap = overlap.loc[overlap['Date'] < last_date, :]
+    if overlap.shape[0] == 0:
+        return True
+    if not np.allclose(overlap['Close'], overlap['Close_recent'], rtol=const.SHARE_PRICE_ADJUSTMENT_RTOL, atol=0):
+        return True
+    if 'Stock Splits' in recent.columns:
+        return bool((recent.loc[recent['Date'] >= last_date, 'Stock Splits'].fillna(0) != 0).any())
+    return False
+
+
+def refresh_price_history(ticker, path):
+    """Refreshes price history of ticker stored in csv file path. Only days since the last stored date are downloaded
+    (see needs_full_reload for cases which need full reload).
+    Returns refreshed history and refresh mode: 'full', 'append', 'up to date' or 'no data'.
+    """
+    stored = pd.read_csv(path) if os.path.exists(path) else None
+    if stored is None or stored.shape[0] == 0 or 'Date' not in stored.columns:
+        history = fetch_share_price_history(ticker, period=const.SHARE_PRICE_PERIOD)
+        return history, 'full' if history is not None else 'no data'
+
+    last_date = stored['Date'].max()
+    start = pd.Timestamp(last_date) - pd.Timedelta(days=const.SHARE_PRICE_OVERLAP_DAYS)
+    recent = fetch_share_price_history(ticker, start=start.strftime('%Y-%m-%d'))
+    if recent is None:
+        return stored, 'up to date'
+    recent['Date'] = recent['Date'].astype(str)
+
+    if needs_full_reload(stored, recent):
+        history = fetch_share_price_history(ticker, period=const.SHARE_PRICE_PERIOD)
+        return history, 'full' if history is not None else 'no data'
+
+    # the last stored date is replaced, it may have been an intraday close
+    new_rows = recent.loc[recent['Date'] >= last_date, :]
+    if new_rows.shape[0] == 0 or (new_rows['Date'].max() == last_date and
+                                  new_rows['Close'].iloc[-1] == stored['Close'].iloc[-1]):
+        return stored, 'up to date'
+    history = pd.concat([stored.loc[stored['Date'] < new_rows['Date'].min(), :], new_rows], ignore_index=True)
+    return history, 'append'
+
+
+def download_ticker_share_prices(ticker):
+    """Downloads full share price history of ticker from Yahoo Finance and writes it atomically.
+    Returns number of rows, None if there are no data.
+    """
+    history = fetch_share_price_history(ticker, period=const.SHARE_PRICE_PERIOD)
+    if history is None:
+        print(f'{ticker} no data')
+        return None
+
+    # write to csv, binary price history is rebuilt on the next load
+    utils.maybe_make_dir(const.FLD_SHARE_PRICES)
+    utils.write_csv_atomic(history, f'{const.FLD_SHARE_PRICES}/{ticker}.csv')
+    price_store.invalidate(ticker)
+    return history.shape[0]
+
+
+def update_ticker_share_prices(ticker):
+    """Refreshes stored share price history of ticker (see refresh_price_history) and writes it atomically.
+    Returns refresh mode.
+    """
+    history, mode = refresh_price_history(ticker, f'{const.FLD_SHARE_PRICES}/{ticker}.csv')
+    if mode in ['full', 'append']:
+        # write to csv, binary price history is rebuilt on the next load
+        utils.maybe_make_dir(const.FLD_SHARE_PRICES)
+        utils.write_csv_atomic(history, f'{const.FLD_SHARE_PRICES}/{ticker}.csv')
+        price_store.invalidate(ticker)
+    return mode
+
+
+def download_all_share_prices(tickers_list, fetch=update_ticker_share_prices, engine=None):
+    # tickers_list = get_available_tickers()
+    """Refreshes share prices of all available tickers concurrently (see algo.downloader).
+    Only days since the last stored date are downloaded by default, pass fetch=download_ticker_share_prices to
+    download full histories. Parameter fetch processes a single ticker, e.g. from a local stub server in tests and
+    benchmarks. Returns dictionary of errors of failed tickers.
+    """
+    engine = get_yfinance_downloader() if engine is None else engine
+    results, errors = engine.run(tickers_list, const.HOST_YAHOO_PRICES, fetch)
+    if fetch is update_ticker_share_prices:
+        print(pd.Series(results, dtype=object).value_counts().to_string())
+    return errors
+
+
+def download_sp500_returns():
+    """Downloads S&P 500 Y-O-Y returns for the last 30 years.
+    Only days since the last stored date are downloaded if the history is stored (see refresh_price_history).
+    """
+    history, mode = refresh_price_history('^GSPC', const.PATH_SP500_RETURNS)
+    if mode not in ['full', 'append']:
+        print(f'S&P 500 returns {mode}')
+        return None
+
+    # returns are computed again on the whole history, they span 252 trading days
+    history = history.drop(columns=['year', 'return'], errors='ignore')
     history['year'] = pd.to_datetime(history['Date']).dt.year
     history['return'] = history['Close'].pct_change(periods=252)
 
     # save to csv
     utils.maybe_make_dir(const.FLD_SP500_RETURNS)
-    history.to_csv(f'{const.FLD_SP500_RETURNS}/{const.FILE_SP500_RETURNS}', index=False)
+    utils.write_csv_atomic(history, f'{const.FLD_SP500_RETURNS}/{const.FILE_SP500_RETURNS}')
+    fd.get_macro_calendar.cache_clear()
     return None
 
 
 def get_sp500_return(date):
     """Gets the S&P 500 year-over-year returns for a given date."""
-    returns = pd.read_csv(f'{const.FLD_SP500_RETURNS}/{const.FILE_SP500_RETURNS}')
-
-    # get the last available observation before the date
-    returns_before_date = returns.loc[returns['Date'] <= date, 'return']
-    if returns_before_date.shape[0] == 0:
-        return None
-    else:
-        return returns_before_date.iloc[-1]
+    return fd.get_sp500_return_at_date(date)
 
 
 def get_accepted_date(ticker, drop_count_col=True):
-    """Gets accepted date for each statement date given ticker."""
-    res = pd.read_csv(os.path.join(const.FLD_STATEMENTS, f'{ticker}.csv'))[['accepted', 'date']]
-
-    # count number of rows per date
-    res['count'] = res.groupby('date')['accepted'].transform('count')
-
-    # sort by count descending
-    res = res.sort_values('count', ascending=False)
-
-    # within each date get only the first row (i.e. the most frequent one)
+    """Gets accepted date for each statement date given ticker (the most frequent one within each date)."""
+    res = statement_cache.get(ticker).get_accepted_dates()
 
     if drop_count_col:
-        return res.groupby('date').first().reset_index().drop(columns=['count'])
+        return res.drop(columns=['count'])
     else:
-        return res.groupby('date').first().reset_index()
+        return res
 
 
 def materialize_accepted_dates_DEPREC():
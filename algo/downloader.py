@@ -0,0 +1,116 @@
+"""
+This module contains a concurrent download engine used by the download_all_* functions of algo.data_acquisition.
+Tasks (e.g. one ticker each) run in a thread pool. Requests of all tasks share a global rate limiter and the number of
+concurrent requests to each host is capped. Tasks failing with a retryable error (throttling, server errors, dropped
+connections) are retried with exponential backoff, other errors are collected and reported at the end of the run.
+Fetch functions write their results themselves (atomically, one file per ticker), so that finished tickers are kept
+if the run is interrupted.
+Fetch functions going through the on-disk cache of algo.http_client take the request slot themselves (run with
+throttle=False and pass Downloader.slot to http_client.get), so that only requests to the network are throttled.
+"""
+
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+import requests
+import algo.constants as const
+
+
+class RetryableError(Exception):
+    """Raised for responses worth retrying, e.g. HTTP 429 or 5xx."""
+
+
+RETRYABLE_ERRORS = (RetryableError, requests.ConnectionError, requests.Timeout)
+
+
+def raise_for_status(response):
+    """Raises RetryableError for throttling and server errors, requests.HTTPError for other error responses."""
+    if response.status_code == 429 or response.status_code >= 500:
+        raise RetryableError(f'{response.status_code} for url {response.url}')
+    response.raise_for_status()
+    return None
+
+
+def get_host(url):
+    return urlsplit(url).netloc
+
+
+class RateLimiter:
+    """Spaces acquisitions of all threads evenly, at most rate per second (no limit if rate is None)."""
+
+    def __init__(self, rate):
+        self._interval = 0.0 if rate is None else 1.0 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self._interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class Downloader:
+    """Runs fetch functions concurrently with a global rate limit, per-host concurrency caps and retries."""
+
+    def __init__(self, n_workers=const.DOWNLOAD_WORKERS, rate=const.DOWNLOAD_RATE_PER_SECOND,
+                 host_limits=const.DOWNLOAD_HOST_LIMITS, default_host_limit=const.DOWNLOAD_DEFAULT_HOST_LIMIT,
+                 retries=const.DOWNLOAD_RETRIES, backoff=const.DOWNLOAD_BACKOFF_SECONDS,
+                 retryable_errors=RETRYABLE_ERRORS):
+        self.n_workers = n_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.retryable_errors = retryable_errors
+        self._rate_limiter = RateLimiter(rate)
+        self._host_slots = defaultdict(lambda: threading.BoundedSemaphore(default_host_limit))
+        self._host_slots.update({host: threading.BoundedSemaphore(limit) for host, limit in host_limits.items()})
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, host):
+        """Holds one of the concurrent request slots of host, waiting for the global rate limiter."""
+        with self._lock:
+            semaphore = self._host_slots[host]
+        with semaphore:
+            self._rate_limiter.acquire()
+            yield
+
+    def fetch(self, key, host, fetch, throttle=True):
+        """Calls fetch(key) in a slot of host (unless throttle is False, see slot), retrying retryable errors with
+        exponential backoff and jitter.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                if not throttle:
+                    return fetch(key)
+                with self.slot(host):
+                    return fetch(key)
+            except self.retryable_errors as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * 2 ** attempt * (1 + random.random())
+                print(f'{key} failed ({e}), retry {attempt + 1} in {delay:.1f} s')
+                time.sleep(delay)
+
+    def run(self, keys, host, fetch, throttle=True):
+        """Calls fetch(key) for all keys concurrently.
+        If throttle is False, fetch is responsible for taking slot of host around its network requests.
+        Returns dictionary of results and dictionary of errors of failed keys (keys in input order).
+        """
+        results, errors = {}, {}
+        with ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+            futures = {key: executor.submit(self.fetch, key, host, fetch, throttle) for key in keys}
+            for key, future in futures.items():
+                try:
+                    results[key] = future.result()
+                except Exception as e:
+                    errors[key] = e
+                    print(f'{key} failed: {e}')
+        print(f'downloaded {len(results)} out of {len(futures)}, {len(errors)} failed')
+        return results, errors
@@ -1,35 +1,93 @@
 """
 This module contains functions to fetch frequently used datasets to keep them in memory.
+Datasets are loaded lazily on the first access and memoized, e.g. get_rf_rates() or fd.rf_rates.
+The SEC company list is read from an on-disk snapshot, refreshed after const.SEC_COMPANIES_TTL_DAYS.
+In offline mode (const.OFFLINE) the network is never accessed.
 """
 
+import json
+import time
 import numpy as np
 import pandas as pd
 import os
 import algo.constants as const
+import algo.profiling as profiling
+import algo.utils as utils
+import algo.http_client as http_client
+import algo.results_store as results_store
 import requests
+from functools import lru_cache
 
 
 def fetch_erp_data(fetch_col):
     """Fetch ERP data from CSV file. Limit data to minimum year."""
     # load erp data from csv file and limit data to minimum year
+    profiling.count_file_read(const.PATH_ERP)
     erp_data = pd.read_csv(const.PATH_ERP)
     erp_data = erp_data[erp_data['date'] >= f'{const.FETCH_MIN_YEAR}-01-01']
 
     return erp_data[['date'] + [fetch_col]]
 
 
-erp_rates = fetch_erp_data('erp_fcfe_sustainable_payout')
-growth_rates = fetch_erp_data('analyst_growth_estimate')
+@lru_cache(maxsize=None)
+def get_erp_rates():
+    return fetch_erp_data('erp_fcfe_sustainable_payout')
+
+
+@lru_cache(maxsize=None)
+def get_growth_rates():
+    return fetch_erp_data('analyst_growth_estimate')
+
+
+def download_sec_companies_snapshot():
+    """Downloads the list of companies from the SEC and saves it as snapshot json file."""
+    if const.OFFLINE:
+        raise RuntimeError('SEC company list can not be downloaded in offline mode')
+
+    # revalidated on each download, an unchanged list is served from the http cache
+    response = http_client.get(const.URL_SEC_COMPANIES, headers=const.SEC_HEADERS, ttl=0)
+    response.raise_for_status()
+    data = response.json()
+
+    # write to temporary file first, so that readers never see partial file
+    utils.maybe_make_dir(os.path.dirname(const.PATH_SEC_COMPANIES))
+    path_tmp = f'{const.PATH_SEC_COMPANIES}.{os.getpid()}.tmp'
+    with open(path_tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(path_tmp, const.PATH_SEC_COMPANIES)
+
+    return data
+
+
+def load_sec_companies_snapshot():
+    """Loads the SEC company list, downloading a new snapshot if it is missing or older than TTL.
+    Falls back to a stale snapshot if the download fails. In offline mode only the snapshot is used.
+    """
+    path = const.PATH_SEC_COMPANIES
+    exists = os.path.exists(path)
+    is_fresh = exists and (time.time() - os.path.getmtime(path) < const.SEC_COMPANIES_TTL_DAYS * 24 * 60 * 60)
+
+    if const.OFFLINE and not exists:
+        raise FileNotFoundError(f'SEC company list snapshot {path} does not exist (offline mode)')
+
+    if (not is_fresh) and (not const.OFFLINE):
+        try:
+            return download_sec_companies_snapshot()
+        except (requests.exceptions.RequestException, ValueError):
+            if not exists:
+                raise
+            print(f'SEC company list download failed, using stale snapshot {path}')
+
+    profiling.count_file_read(path)
+    with open(path) as f:
+        return json.load(f)
 
 
 def fetch_sec_companies(keep_cik_num=False):
     """Retrieves the list of companies from the SEC"""
 
-    # create request header and get all companies data
-    response = requests.get("https://www.sec.gov/files/company_tickers.json", headers=const.SEC_HEADERS)
-
     # convert to dataframe and format columns
-    company_data = pd.DataFrame.from_dict(response.json(), orient='index')
+    company_data = pd.DataFrame.from_dict(load_sec_companies_snapshot(), orient='index')
     company_data['cik_str'] = company_data['cik_str'].astype(str).str.zfill(10)
 
     if keep_cik_num:
@@ -38,52 +96,171 @@ def fetch_sec_companies(keep_cik_num=False):
     return company_data
 
 
-sec_companies = fetch_sec_companies()
+@lru_cache(maxsize=None)
+def get_sec_companies():
+    return fetch_sec_companies()
 
 
 def fetch_rf_rates():
     """Get the risk-free rate (10Y US TREASURY NOTES) at a given date."""
+    profiling.count_file_read(os.path.join(const.FLD_TNOTES, const.FILE_TNOTES))
     tnotes = pd.read_csv(os.path.join(const.FLD_TNOTES, const.FILE_TNOTES))
     tnotes = tnotes[['Date', 'DGS10']].dropna().loc[tnotes['Date'] >= f'{const.FETCH_MIN_YEAR}-01-01']
     tnotes.columns = ['date', 'rf_rate']
     return tnotes
 
 
-rf_rates = fetch_rf_rates()
+@lru_cache(maxsize=None)
+def get_rf_rates():
+    return fetch_rf_rates()
 
 
 def fetch_implied_perp_g_rates():
     """Fetch implied perpetual growth rates."""
-    res = pd.read_csv(const.PATH_IMPLIED_PERP_G_RATES)
+    res = results_store.read_implied_perp_g_rates()
     # convert date to datetime
     res['date'] = pd.to_datetime(res['date'])
     return res
 
 
-implied_perp_g_rates = fetch_implied_perp_g_rates()
+@lru_cache(maxsize=None)
+def get_implied_perp_g_rates():
+    return fetch_implied_perp_g_rates()
 
 
 def fetch_implied_perp_g_rates_p50():
     """Fetch implied perpetual growth rates."""
+    profiling.count_file_read(const.PATH_IMPLIED_PERP_G_RATES_P50)
     return pd.read_csv(const.PATH_IMPLIED_PERP_G_RATES_P50)
 
 
-implied_perp_g_rates_p50 = fetch_implied_perp_g_rates_p50()
-mean_implied_perp_g_rates_p50 = np.mean(implied_perp_g_rates_p50['implied_perp_g_rate'])
+@lru_cache(maxsize=None)
+def get_implied_perp_g_rates_p50():
+    return fetch_implied_perp_g_rates_p50()
+
+
+@lru_cache(maxsize=None)
+def get_mean_implied_perp_g_rates_p50():
+    return np.mean(get_implied_perp_g_rates_p50()['implied_perp_g_rate'])
+
+
+def fetch_sp500_returns():
+    """Fetch S&P 500 year-over-year returns."""
+    profiling.count_file_read(const.PATH_SP500_RETURNS)
+    returns = pd.read_csv(const.PATH_SP500_RETURNS)[['Date', 'return']]
+    returns.columns = ['date', 'sp500_return']
+    return returns
+
+
+# module attributes kept for backward compatibility, loaded on the first access
+LAZY_DATASETS = {
+    'erp_rates': get_erp_rates,
+    'growth_rates': get_growth_rates,
+    'sec_companies': get_sec_companies,
+    'rf_rates': get_rf_rates,
+    'implied_perp_g_rates': get_implied_perp_g_rates,
+    'implied_perp_g_rates_p50': get_implied_perp_g_rates_p50,
+    'mean_implied_perp_g_rates_p50': get_mean_implied_perp_g_rates_p50,
+}
+
+
+def __getattr__(name):
+    if name in LAZY_DATASETS:
+        return LAZY_DATASETS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def to_days(dates):
+    """Converts array of dates (strings or datetimes) to int64 day ordinals, i.e. days since 1970-01-01."""
+    return pd.to_datetime(pd.Series(dates)).to_numpy(dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int64)
+
+
+class MacroCalendar:
+    """Macro time series aligned on a common calendar of sorted int64 day keys.
+    Each calendar day holds the last observation of every series on or before that day.
+    """
+
+    def __init__(self, series):
+        self.names = list(series.keys())
+        self.col_idx = {name: idx for idx, name in enumerate(self.names)}
+
+        keys = {}
+        for name, df in series.items():
+            df = df.assign(day=to_days(df['date'])).sort_values('day', kind='stable')
+            keys[name] = (df['day'].to_numpy(), df.iloc[:, 1].to_numpy(dtype=float))
+        self.days = np.unique(np.concatenate([day for day, _ in keys.values()]))
+
+        # as-of values of each series on the calendar, NaN before the first observation
+        self.values = np.full((self.days.shape[0], len(self.names)), np.nan)
+        self.first_idx = np.zeros(len(self.names), dtype=np.int64)
+        for col, name in enumerate(self.names):
+            day, value = keys[name]
+            pos = np.searchsorted(day, self.days, side='right') - 1
+            self.values[pos >= 0, col] = value[pos[pos >= 0]]
+            self.first_idx[col] = np.searchsorted(self.days, day[0]) if day.shape[0] > 0 else self.days.shape[0]
+
+    def lookup(self, name, dates):
+        """Returns values of series name as of each of dates. NaN where there is no observation yet."""
+        pos = np.searchsorted(self.days, to_days(dates), side='right') - 1
+        col = self.col_idx[name]
+        found = pos >= self.first_idx[col]
+        return np.where(found, self.values[np.maximum(pos, 0), col], np.nan)
+
+    def get(self, name, date):
+        """Returns value of series name as of date. Raises IndexError if there is no observation yet."""
+        pos = np.searchsorted(self.days, to_days([date])[0], side='right') - 1
+        col = self.col_idx[name]
+        if pos < self.first_idx[col]:
+            raise IndexError(f'No {name} observation on or before {date}')
+        return self.values[pos, col]
+
+
+@lru_cache(maxsize=None)
+@profiling.timed('io.load_macro')
+def get_macro_calendar():
+    """Returns macro calendar of risk-free rates, ERP, growth rates and S&P 500 returns (if downloaded)."""
+    series = {
+        'rf_rate': get_rf_rates(),
+        'erp': get_erp_rates(),
+        'growth_rate': get_growth_rates(),
+    }
+    if os.path.exists(const.PATH_SP500_RETURNS):
+        series['sp500_return'] = fetch_sp500_returns()
+    return MacroCalendar(series)
+
+
+def get_macro_at_dates(dates):
+    """Returns dataframe with rf_rate, erp, growth_rate (and sp500_return) as of each of dates."""
+    calendar = get_macro_calendar()
+    res = pd.DataFrame({name: calendar.lookup(name, dates) for name in calendar.names})
+    res['rf_rate'] = res['rf_rate'] / 100
+    return res
 
 
+@profiling.timed('valuation.macro')
 def get_rf_rate_at_date(date):
     """Get the risk-free rate (10Y US TREASURY NOTES) at a given date."""
-    return rf_rates.loc[rf_rates['date'] <= date, 'rf_rate'].iloc[-1] / 100
+    return get_macro_calendar().get('rf_rate', date) / 100
 
 
+@profiling.timed('valuation.macro')
 def get_growth_rate_at_date(date):
     """Get the growth rate at a given date."""
-    return growth_rates.loc[growth_rates['date'] <= date, 'analyst_growth_estimate'].iloc[-1]
+    return get_macro_calendar().get('growth_rate', date)
 
 
+@profiling.timed('valuation.macro')
 def get_erp_at_date(date):
     """Get the equity risk premium at a given date."""
-    return erp_rates.loc[erp_rates['date'] <= date, 'erp_fcfe_sustainable_payout'].iloc[-1]
-
-
+    return get_macro_calendar().get('erp', date)
+
+
+def get_sp500_return_at_date(date):
+    """Get the S&P 500 year-over-year return at a given date. Returns None if there is no observation."""
+    calendar = get_macro_calendar()
+    if 'sp500_return' not in calendar.col_idx:
+        raise FileNotFoundError(const.PATH_SP500_RETURNS)
+    try:
+        return calendar.get('sp500_return', date)
+    except IndexError:
+        return None
@@ -0,0 +1,56 @@
+"""
+This module computes fingerprints of valuation inputs for each (ticker, date) row.
+A row has to be recomputed only if its fingerprint differs from the one stored with its result.
+Inputs are the statement values of const.FUNDAMENTAL_CONCEPTS, share price, beta, macro rates,
+the perpetual growth rate used for the terminal value and const.MODEL_VERSION.
+"""
+
+import hashlib
+import numpy as np
+import pandas as pd
+import algo.constants as const
+import algo.data_acquisition as da
+import algo.fetched_data as fd
+import algo.modelling as model
+
+INPUT_COLUMNS = ['ticker', 'date', 'statement_hash', 'share_price', 'beta', 'rf_rate', 'erp', 'growth_rate',
+                 'perp_growth_rate']
+
+
+def get_statement_hash(ticker, year):
+    """Returns hash of all statement values of the model concepts for ticker and year."""
+    statements = da.statement_cache.get(ticker)
+    values = [(concept, tuple(statements.get_values(concept, year).tolist()))
+              for concept in const.MODEL_CONCEPTS]
+    return hashlib.sha1(repr(values).encode()).hexdigest()
+
+
+def collect_inputs(ticker, dates, with_perp_growth_rate=True, betas=None):
+    """Collects fingerprint inputs of all dates of a single ticker.
+    Parameter betas is the dictionary of da.get_betas(), loaded if not given (pass it when collecting many tickers).
+    """
+    inputs = pd.DataFrame({'ticker': ticker, 'date': list(dates)})
+    years = pd.to_datetime(inputs['date']).dt.year
+
+    inputs['statement_hash'] = [get_statement_hash(ticker, year) for year in years]
+    inputs['share_price'] = da.get_share_prices_around_dates(inputs, offsets=[0], date_col='date')['share_price_0d']
+    inputs['beta'] = (da.get_betas() if betas is None else betas).get(ticker, np.nan)
+
+    macro = fd.get_macro_at_dates(inputs['date'])
+    for col in ['rf_rate', 'erp', 'growth_rate']:
+        inputs[col] = macro[col].to_numpy()
+
+    if with_perp_growth_rate:
+        inputs['perp_growth_rate'] = [model.get_perp_growth_rate(ticker, date, create_lag=True)
+                                      for date in inputs['date']]
+    else:
+        inputs['perp_growth_rate'] = np.nan
+
+    return inputs
+
+
+def get_input_fingerprints(inputs):
+    """Returns array of hexadecimal fingerprints, one for each row of inputs (see INPUT_COLUMNS)."""
+    hashes = pd.util.hash_pandas_object(inputs[INPUT_COLUMNS].assign(model_version=const.MODEL_VERSION),
+                                        index=False).to_numpy()
+    return np.array([f'{h:016x}' for h in hashes], dtype=object)
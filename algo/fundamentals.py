@@ -0,0 +1,127 @@
+"""
+This module materializes the statement concepts used by the intrinsic value model into a dense matrix.
+Rows are (ticker, fiscal year) pairs, columns are items of const.FUNDAMENTAL_CONCEPTS with fallbacks resolved.
+The matrix and its availability mask are stored as .npy files and loaded by memory-mapping.
+"""
+
+import json
+import os
+import numpy as np
+import pandas as pd
+import algo.constants as const
+import algo.data_acquisition as da
+import algo.utils as utils
+
+FILE_VALUES = 'values.npy'
+FILE_MASK = 'mask.npy'
+FILE_INDEX = 'index.csv'
+FILE_ITEMS = 'items.json'
+
+
+class Fundamentals:
+    """Dense fundamentals matrix with availability mask and (ticker, year, date) row index."""
+
+    def __init__(self, values, mask, index, items):
+        self.values = values
+        self.mask = mask
+        self.index = index
+        self.items = items
+        self.item_idx = {item: idx for idx, item in enumerate(items)}
+        self.row_idx = {(ticker, year): idx for idx, (ticker, year) in
+                        enumerate(zip(index['ticker'], index['year']))}
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    def column(self, item, rows=None):
+        """Returns values of item (NaN where not available), optionally limited to row positions."""
+        col = self.item_idx[item]
+        values = self.values[:, col] if rows is None else self.values[rows, col]
+        mask = self.mask[:, col] if rows is None else self.mask[rows, col]
+        return np.where(mask, values, np.nan)
+
+    def available(self, item, rows=None):
+        """Returns availability mask of item, optionally limited to row positions."""
+        col = self.item_idx[item]
+        return np.asarray(self.mask[:, col] if rows is None else self.mask[rows, col])
+
+    def get_rows(self, tickers=None):
+        """Returns row positions for given tickers (all rows if tickers is None)."""
+        if tickers is None:
+            return np.arange(len(self))
+        return np.flatnonzero(self.index['ticker'].isin(tickers).to_numpy())
+
+
+def load_fundamental_statements():
+    """Loads statements of all concepts in const.FUNDAMENTAL_CONCEPTS together with all statement dates."""
+    concepts = const.MODEL_CONCEPTS
+
+    if os.path.isdir(const.FLD_STATEMENTS_DATASET):
+        dates = da.read_statements(columns=['ticker', 'date']).drop_duplicates()
+        statements = da.read_statements(concepts=concepts, columns=['ticker', 'date', 'concept', 'val'])
+    else:
+        data = pd.concat((da.load_ticker_statements(ticker) for ticker in da.get_available_tickers()),
+                         ignore_index=True)
+        dates = data[['ticker', 'date']].drop_duplicates()
+        statements = data.loc[data['concept'].isin(concepts), ['ticker', 'date', 'concept', 'val']]
+
+    for df in [dates, statements]:
+        df['ticker'] = df['ticker'].astype(str)
+        df['date'] = pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d')
+        df['year'] = pd.to_datetime(df['date']).dt.year
+    statements['concept'] = statements['concept'].astype(str)
+
+    return dates, statements
+
+
+def build_fundamentals(fld_save=const.FLD_FUNDAMENTALS):
+    """Builds the fundamentals matrix from statement data and saves it to fld_save."""
+    dates, statements = load_fundamental_statements()
+    items = list(const.FUNDAMENTAL_CONCEPTS.keys())
+
+    # one row per ticker and fiscal year, keep the last statement date within the year
+    index = dates.sort_values(['ticker', 'date']).groupby(['ticker', 'year']).last().reset_index()
+    index = index[['ticker', 'year', 'date']]
+
+    # pivot concepts into columns aligned with the index
+    statements = statements.drop_duplicates(subset=['ticker', 'year', 'concept'], keep='last')
+    pivot = statements.pivot(index=['ticker', 'year'], columns='concept', values='val')
+    present = statements.assign(present=1).pivot(index=['ticker', 'year'], columns='concept', values='present')
+    keys = pd.MultiIndex.from_frame(index[['ticker', 'year']])
+    pivot = pivot.reindex(keys)
+    present = present.reindex(keys).notna()
+
+    # resolve fallbacks, the first concept with an observation wins
+    values = np.full((index.shape[0], len(items)), np.nan)
+    mask = np.zeros((index.shape[0], len(items)), dtype=bool)
+    for col, item in enumerate(items):
+        for concept in const.FUNDAMENTAL_CONCEPTS[item]:
+            if concept not in pivot.columns:
+                continue
+            fill = ~mask[:, col] & present[concept].to_numpy()
+            values[fill, col] = pivot[concept].to_numpy()[fill]
+            mask[fill, col] = True
+
+    # save
+    utils.maybe_make_dir(fld_save)
+    np.save(os.path.join(fld_save, FILE_VALUES), values)
+    np.save(os.path.join(fld_save, FILE_MASK), mask)
+    index.to_csv(os.path.join(fld_save, FILE_INDEX), index=False)
+    with open(os.path.join(fld_save, FILE_ITEMS), 'w') as f:
+        json.dump(items, f)
+
+    return Fundamentals(values, mask, index, items)
+
+
+def load_fundamentals(fld_load=const.FLD_FUNDAMENTALS):
+    """Loads the fundamentals matrix saved by build_fundamentals. Arrays are memory-mapped."""
+    values = np.load(os.path.join(fld_load, FILE_VALUES), mmap_mode='r')
+    mask = np.load(os.path.join(fld_load, FILE_MASK), mmap_mode='r')
+    index = pd.read_csv(os.path.join(fld_load, FILE_INDEX), dtype={'ticker': str, 'date': str}, keep_default_na=False)
+    with open(os.path.join(fld_load, FILE_ITEMS)) as f:
+        items = json.load(f)
+
+    if items != list(const.FUNDAMENTAL_CONCEPTS.keys()):
+        raise ValueError('Fundamentals matrix is outdated, rebuild it with build_fundamentals()')
+
+    return Fundamentals(values, mask, index, items)
@@ -0,0 +1,151 @@
+"""
+This module contains the shared HTTP layer of SEC and Yahoo calls.
+Requests go through pooled keep-alive sessions (one per thread, so that it can be used by algo.downloader workers).
+Successful GET responses are kept in an on-disk cache in const.FLD_HTTP_CACHE. Bodies are content-addressed
+(stored once per sha256 of the body), entries map request urls to bodies with response headers and fetch time.
+Entries younger than ttl are served without a request, older ones are revalidated with If-None-Match/If-Modified-Since
+if the server sent ETag/Last-Modified, a 304 response only refreshes the fetch time.
+In replay-only mode (environment variable ALGO_HTTP_REPLAY=1, implied by offline mode, or parameter replay of get)
+responses are served from the cache regardless of their age and the network is never accessed, a missing entry raises
+CacheMissError.
+Concurrent downloads pass a request slot of algo.downloader (host concurrency cap and rate limit) to get, it is taken
+only for requests which go to the network, so that cache hits are not throttled.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+import algo.constants as const
+import algo.utils as utils
+
+# response headers kept in cache entries
+CACHED_HEADERS = ['Content-Type', 'ETag', 'Last-Modified']
+
+_local = threading.local()
+
+
+class CacheMissError(requests.exceptions.RequestException):
+    """Raised in replay-only mode for requests which are not cached."""
+
+
+def get_session():
+    """Returns keep-alive session of the current thread."""
+    if not hasattr(_local, 'session'):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=const.HTTP_POOL_SIZE, pool_maxsize=const.HTTP_POOL_SIZE)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _local.session = session
+    return _local.session
+
+
+def get_entry_path(url, fld=const.FLD_HTTP_CACHE):
+    key = hashlib.sha256(url.encode()).hexdigest()
+    return os.path.join(fld, 'entries', key[:2], f'{key}.json')
+
+
+def get_body_path(sha256, fld=const.FLD_HTTP_CACHE):
+    return os.path.join(fld, 'bodies', sha256[:2], sha256)
+
+
+def write_atomic(path, data):
+    """Writes bytes via temporary file unique to the process and thread, so that readers never see partial file."""
+    utils.maybe_make_dir(os.path.dirname(path))
+    path_tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(path_tmp, 'wb') as f:
+        f.write(data)
+    os.replace(path_tmp, path)
+    return None
+
+
+def load_entry(url, fld=const.FLD_HTTP_CACHE):
+    """Returns cache entry of url, None if it is not cached (or its body is missing)."""
+    path = get_entry_path(url, fld)
+    try:
+        with open(path) as f:
+            entry = json.load(f)
+    except FileNotFoundError:
+        return None
+    if not os.path.exists(get_body_path(entry['sha256'], fld)):
+        return None
+    return entry
+
+
+def save_entry(url, response, fld=const.FLD_HTTP_CACHE):
+    """Saves body of response (unless already stored) and cache entry of url. Returns the entry."""
+    sha256 = hashlib.sha256(response.content).hexdigest()
+    if not os.path.exists(get_body_path(sha256, fld)):
+        write_atomic(get_body_path(sha256, fld), response.content)
+
+    entry = {
+        'url': url,
+        'sha256': sha256,
+        'headers': {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers},
+        'fetched': time.time(),
+    }
+    write_atomic(get_entry_path(url, fld), json.dumps(entry).encode())
+    return entry
+
+
+def to_response(url, entry, fld=const.FLD_HTTP_CACHE):
+    """Builds response of cache entry."""
+    response = requests.Response()
+    response.url = url
+    response.status_code = 200
+    response.headers = CaseInsensitiveDict(entry['headers'])
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    with open(get_body_path(entry['sha256'], fld), 'rb') as f:
+        response._content = f.read()
+    return response
+
+
+def request(url, headers=None, timeout=const.DOWNLOAD_TIMEOUT_SECONDS, slot=None):
+    """GET request through the shared session, holding slot(host of url) during the request if slot is given."""
+    if slot is None:
+        return get_session().get(url, headers=headers, timeout=timeout)
+    with slot(urlsplit(url).netloc):
+        return get_session().get(url, headers=headers, timeout=timeout)
+
+
+def get(url, headers=None, ttl=const.HTTP_CACHE_TTL_SECONDS, timeout=const.DOWNLOAD_TIMEOUT_SECONDS,
+        fld=const.FLD_HTTP_CACHE, replay=None, slot=None):
+    """GET request through the shared session and the on-disk cache (ttl in seconds, None disables the cache).
+    Only successful responses are cached, other responses are returned as they are.
+    Parameter replay switches replay-only mode on or off (const.HTTP_REPLAY if None), e.g. for a local stub server.
+    Parameter slot is a context manager factory taking host (e.g. algo.downloader.Downloader.slot), held only while
+    a request goes to the network.
+    """
+    replay = const.HTTP_REPLAY if replay is None else replay
+    if ttl is None and not replay:
+        return request(url, headers, timeout, slot)
+
+    entry = load_entry(url, fld)
+    if replay:
+        if entry is None:
+            raise CacheMissError(f'{url} is not cached (replay-only mode)')
+        return to_response(url, entry, fld)
+
+    if entry is not None and time.time() - entry['fetched'] < ttl:
+        return to_response(url, entry, fld)
+
+    # revalidate expired entry if the server sent validators
+    headers = dict(headers or {})
+    if entry is not None and 'ETag' in entry['headers']:
+        headers['If-None-Match'] = entry['headers']['ETag']
+    if entry is not None and 'Last-Modified' in entry['headers']:
+        headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+
+    response = request(url, headers, timeout, slot)
+    if response.status_code == 304 and entry is not None:
+        entry['fetched'] = time.time()
+        write_atomic(get_entry_path(url, fld), json.dumps(entry).encode())
+        return to_response(url, entry, fld)
+    if response.status_code == 200:
+        save_entry(url, response, fld)
+    return response
@@ -2,15 +2,11 @@
 Main script for running the intrinsic value calculation for all available tickers
 In the first part, the script will estimate the implied perpetual growth rate
 In the second part, the script will calculate the intrinsic value
+Tickers are processed in parallel worker processes, see algo.runner
 """
-import os
-from importlib import reload
-import pandas as pd
-import numpy as np
 import algo.data_acquisition as da
 import algo.constants as const
-import algo.utils as utils
-import algo.modelling as model
+import algo.runner as runner
 
 
 available_tickers = da.get_available_tickers()
@@ -18,32 +14,18 @@ available_tickers = da.get_available_tickers()
 # available_tickers = ['A', 'AAL', 'AAPL', 'ABBV', 'ABNB']
 # available_tickers = ['AAPL']
 
+# case: estimate implied perpetual growth rate (True) or get intrinsic value (False)
 optimize_perp_g_rate = False
 
-# iterate over all available tickers
-for idx, ticker in enumerate(available_tickers):
-    # ticker = available_tickers[0]  # debug
-    print(ticker)
+# vectorized calculation (requires fundamentals matrix, see algo.fundamentals)
+use_batch_engine = False
 
-    # get all dates for the ticker
-    dates = da.get_ticker_dates(ticker)
-
-    # case: estimate implied perpetual growth rate
-    if optimize_perp_g_rate:
-        results_g_rates = pd.DataFrame(data=None, columns=['ticker', 'date', 'implied_perp_g_rate'])
-        for date in dates:
-            # date = dates[0]  # debug
-            results_g_rates = model.get_optimized_perp_g_rate(ticker, date, results_g_rates)
-        utils.upsert_into_df(results_g_rates, const.FLD_IMPLIED_PERP_G_RATES,
-                             const.FILE_IMPLIED_PERP_G_RATES, ['ticker', 'date'])
-
-    # case: get intrinsic value
-    else:
-        results_values = pd.DataFrame(data=None,
-                                      columns=['ticker', 'date', 'intrinsic_value', 'share_price', 'error_message'])
-        for date in dates:
-            # date = dates[0]  # debug
-            results_values = model.get_intrinsic_value_wrapper(ticker, date, results_values)
-        utils.upsert_results(results_values)
+# recompute all rows, otherwise only rows with changed inputs are recomputed (see algo.fingerprints)
+recompute_all = False
 
+# number of worker processes, use 1 for debugging in a single process
+n_workers = const.N_WORKERS
 
+if __name__ == '__main__':
+    runner.run_valuation(available_tickers, optimize_perp_g_rate=optimize_perp_g_rate,
+                         use_batch_engine=use_batch_engine, n_workers=n_workers, recompute_all=recompute_all)
@@ -9,32 +9,24 @@ import algo.data_acquisition as da
 from algo.utils import if_none, elu, if_nan_none
 import algo.constants as const
 import algo.fetched_data as fd
+import algo.profiling as profiling
 import algo.utils as utils
 import pandas as pd
-from scipy.optimize import minimize_scalar, minimize
 
 
+@profiling.timed('valuation.dcf')
 def get_intrinsic_value(ticker, date, optimize_perp_g_rate=False):
-    """Calculate the intrinsic value of a company using the free cash flow to firm method."""
+    """Calculate the intrinsic value of a company using the free cash flow to firm method.
+    If profiling is enabled, stages are timed by decorators of the called functions, DCF arithmetic is the self time.
+    """
 
     year = pd.to_datetime(date).year
 
-    interest_expense1 = da.get_single_observation(ticker, concept='InterestExpense', year=year)
-    interest_expense2 = da.get_single_observation(ticker, concept='InterestIncomeExpenseNonoperatingNet', year=year)
-    interest_expense = interest_expense1 if interest_expense1 is not None else interest_expense2
-
-    income_tax = da.get_single_observation(ticker, concept='IncomeTaxExpenseBenefit', year=year)
-
-    concept_pretax_income1 = ('IncomeLossFromContinuingOperationsBeforeIncomeTaxesMinority' +
-                              'InterestAndIncomeLossFromEquityMethodInvestments')
-    pretax_income1 = da.get_single_observation(ticker, concept=concept_pretax_income1, year=year)
-
-    concept_pretax_income2 = ('IncomeLossFromContinuingOperationsBeforeIncomeTaxesExtraordinary' +
-                              'ItemsNoncontrollingInterest')
-    pretax_income2 = da.get_single_observation(ticker, concept=concept_pretax_income2, year=year)
-    pretax_income = pretax_income1 if pretax_income1 is not None else pretax_income2
-    long_term_debt = da.get_single_observation(ticker, concept='LongTermDebtNoncurrent', year=year)
-    long_term_lease = da.get_single_observation(ticker, concept='CapitalLeaseObligationsNoncurrent', year=year)
+    interest_expense = da.get_fundamental(ticker, 'interest_expense', year)
+    income_tax = da.get_fundamental(ticker, 'income_tax', year)
+    pretax_income = da.get_fundamental(ticker, 'pretax_income', year)
+    long_term_debt = da.get_fundamental(ticker, 'long_term_debt', year)
+    long_term_lease = da.get_fundamental(ticker, 'long_term_lease', year)
     total_long_term_debt = if_none(long_term_debt, 0) + if_none(long_term_lease, 0)
     effective_tax_rate = income_tax / pretax_income
 
@@ -55,8 +47,8 @@ def get_intrinsic_value(ticker, date, optimize_perp_g_rate=False):
 
     share_price = da.get_share_price(ticker, date)
 
-    com_shares_outstanding = da.get_single_observation(ticker, concept='CommonStockSharesOutstanding', year=year)
-    pref_shares_outstanding = da.get_single_observation(ticker, concept='PreferredStockSharesOutstanding', year=year)
+    com_shares_outstanding = da.get_fundamental(ticker, 'com_shares_outstanding', year)
+    pref_shares_outstanding = da.get_fundamental(ticker, 'pref_shares_outstanding', year)
     shares_outstanding = if_nan_none(com_shares_outstanding, 0) + if_nan_none(pref_shares_outstanding, 0)
 
     # only work with companies that have shares outstanding and share price
@@ -77,7 +69,7 @@ def get_intrinsic_value(ticker, date, optimize_perp_g_rate=False):
     ##########################
     # FCFF - Free cash flow to firm
 
-    operating_income = da.get_single_observation(ticker, 'OperatingIncomeLoss', year=year)
+    operating_income = da.get_fundamental(ticker, 'operating_income', year)
 
     # only work with companies that have shares outstanding
     if operating_income is None:
@@ -85,20 +77,12 @@ def get_intrinsic_value(ticker, date, optimize_perp_g_rate=False):
 
     after_taxt_operating_income = operating_income * (1 - effective_tax_rate)
 
-    concept_net_cash_operating1 = 'NetCashProvidedByUsedInOperatingActivities'
-    concept_net_cash_operating2 = 'NetCashProvidedByUsedInOperatingActivitiesContinuingOperations'
-    net_cash_operating1 = da.get_single_observation(ticker, concept_net_cash_operating1, year=year)
-    net_cash_operating2 = da.get_single_observation(ticker, concept_net_cash_operating2, year=year)
-    net_cash_operating = net_cash_operating1 if net_cash_operating1 is not None else net_cash_operating2
-
-
-    net_income1 = da.get_single_observation(ticker, 'NetIncomeLoss', year=year)
-    net_income2 = da.get_single_observation(ticker, 'ProfitLoss', year=year)
-    net_income = net_income1 if net_income1 is not None else net_income2
-    share_based_compensation = da.get_single_observation(ticker, 'ShareBasedCompensation', year=year)
+    net_cash_operating = da.get_fundamental(ticker, 'net_cash_operating', year)
+    net_income = da.get_fundamental(ticker, 'net_income', year)
+    share_based_compensation = da.get_fundamental(ticker, 'share_based_compensation', year)
 
     reinvestment_operations_part = net_cash_operating - net_income - if_none(share_based_compensation, 0)
-    capex = da.get_single_observation(ticker, 'PaymentsToAcquirePropertyPlantAndEquipment', year=year)
+    capex = da.get_fundamental(ticker, 'capex', year)
     # msft_cash_acquisitions = None  # 8099000000  # this expression is subtracted from reinvestment in Damodaran
 
     reinvestment = reinvestment_operations_part - if_none(capex, 0)
@@ -110,17 +94,16 @@ def get_intrinsic_value(ticker, date, optimize_perp_g_rate=False):
 
     fcff_projection = [fcff * (1 + growth_rate) ** i for i in range(1, 6)]
 
-    cash_and_equivalents = da.get_single_observation(ticker, 'CashAndCashEquivalentsAtCarryingValue', year)
-    current_debt = da.get_single_observation(ticker, 'CurrentDebt', year)
+    cash_and_equivalents = da.get_fundamental(ticker, 'cash_and_equivalents', year)
+    current_debt = da.get_fundamental(ticker, 'current_debt', year)
     equity_val_residual = if_none(cash_and_equivalents, 0) - (if_none(current_debt, 0) + if_none(total_long_term_debt, 0))
 
     if optimize_perp_g_rate:
 
-        optimization_res = minimize_scalar(perp_gr_optimization_wrapper, method='brent',
-                                           args=(fcff_projection.copy(), wacc_rate, equity_val_residual,
-                                                 shares_outstanding, share_price))
-
-        implied_perp_growth_rate = optimization_res.x
+        implied_perp_growth_rate = calc_implied_perp_growth_rate(fcff_projection.copy(), wacc_rate,
+                                                                 equity_val_residual, shares_outstanding, share_price)
+        if np.isnan(implied_perp_growth_rate):
+            return 'Error: no implied perpetual growth rate below WACC', None
 
         intrinsic_value = calc_multiplier_to_intrinsic_value(implied_perp_growth_rate, fcff_projection.copy(),
                                                              wacc_rate, equity_val_residual, shares_outstanding)
@@ -139,10 +122,11 @@ def get_intrinsic_value(ticker, date, optimize_perp_g_rate=False):
 # end of year
 date='2020-12-31'
 
+@profiling.timed('valuation.perp_growth_rate')
 def get_perp_growth_rate(ticker, date, create_lag):
     """Get the last available perpetuity growth rate or return the default value."""
     # load perp_g_rates
-    implied_perp_g_rates = fd.implied_perp_g_rates
+    implied_perp_g_rates = fd.get_implied_perp_g_rates()
 
     # lag the date value by one year
     if create_lag:
@@ -155,10 +139,10 @@ def get_perp_growth_rate(ticker, date, create_lag):
     # get the last available perp growth rate or return the default value
     if before_date.shape[0] == 0:
         # load imputation percentile value and filter for specified year
-        percentile_value = fd.implied_perp_g_rates_p50
+        percentile_value = fd.get_implied_perp_g_rates_p50()
         percentile_value = percentile_value[percentile_value['year'] == pd.to_datetime(date).year]
         if percentile_value.shape[0] == 0:
-            return fd.mean_implied_perp_g_rates_p50
+            return fd.get_mean_implied_perp_g_rates_p50()
         else:
             return percentile_value['implied_perp_g_rate'].iloc[0]
     else:
@@ -179,17 +163,31 @@ def calc_multiplier_to_intrinsic_value(perp_growth_rate, fcff_projection, wacc_r
     return equity_value / shares_outstanding
 
 
-def perp_gr_optimization_wrapper(perp_growth_rate, fcff_projection, wacc_rate,
-                                 equity_val_residual, shares_outstanding, share_price):
-    # optimize the perp_growth_rate
-    intrinsic_value = calc_multiplier_to_intrinsic_value(perp_growth_rate, fcff_projection, wacc_rate,
-                                       equity_val_residual, shares_outstanding)
+@profiling.timed('valuation.optimizer')
+def calc_implied_perp_growth_rate(fcff_projection, wacc_rate, equity_val_residual, shares_outstanding, share_price):
+    """Solves the perpetual growth rate at which intrinsic value equals share price.
+    Intrinsic value is a rational function of the growth rate g, so the root is found in closed form:
+    (1 + g) / (wacc - g) = k  =>  g = (k * wacc - 1) / (1 + k)
+    Returns NaN if there is no root in (-1, wacc). The closed form needs no iterations, only solves are counted.
+    """
+    profiling.count('optimizer.solves')
+    discount = (1 + wacc_rate) ** np.arange(1, len(fcff_projection) + 1)
+    pv_projection = np.sum(np.array(fcff_projection) / discount)
+    pv_last = fcff_projection[-1] / discount[-1]
+
+    # multiplier of the last projected cash flow needed to match the share price
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k = (share_price * shares_outstanding - equity_val_residual - pv_projection) / pv_last
+        perp_growth_rate = (k * wacc_rate - 1) / (1 + k)
 
-    return abs(share_price - intrinsic_value)
+    if not (np.isfinite(perp_growth_rate) and (-1 < perp_growth_rate < wacc_rate)):
+        profiling.count('optimizer.no_root')
+        return np.nan
+    return perp_growth_rate
 
 
 def get_intrinsic_value_wrapper(ticker, date, results):
-    """Get intrinsic value and share price and append to results dataframe. Print results."""
+    """Get intrinsic value and share price and append to results buffer (see algo.result_buffer). Print results."""
     # get share price
     share_price = da.get_share_price(ticker, date)
 
@@ -215,13 +213,13 @@ def get_intrinsic_value_wrapper(ticker, date, results):
         print(f'{ticker} || {date} ||  {error_message}')
 
     # append results
-    results.loc[len(results)] = [ticker, date, intrinsic_value, share_price, error_message]
+    results.append(ticker, date, intrinsic_value, share_price, error_message)
 
     return results
 
 
 def get_optimized_perp_g_rate(ticker, date, results):
-    """Get intrinsic value and share price and append to results dataframe. Print results."""
+    """Get implied perpetual growth rate and append to results buffer (see algo.result_buffer). Print results."""
     # get share price
     share_price = da.get_share_price(ticker, date)
 
@@ -233,7 +231,7 @@ def get_optimized_perp_g_rate(ticker, date, results):
         if isinstance(perp_g_rate, float):
             share_price = da.get_share_price(ticker, date)
             print(f'{ticker} || {date} || perp_g_rate: {round(perp_g_rate, 3)}')
-            results.loc[len(results)] = [ticker, date, perp_g_rate]
+            results.append(ticker, date, perp_g_rate)
     # case: get_intrinsic_value returns a TypeError
     except TypeError:
         pass
@@ -0,0 +1,155 @@
+"""
+This module contains a binary store of share price histories.
+Each ticker history is converted once from csv into a .npy file of (day ordinal, close) records.
+The files are memory-mapped and as-of lookups use binary search.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import algo.constants as const
+import algo.profiling as profiling
+import algo.utils as utils
+
+PRICE_DTYPE = np.dtype([('day', '<i8'), ('close', '<f8')])
+NS_PER_DAY = 24 * 60 * 60 * 10 ** 9
+
+
+def to_day(date):
+    """Converts date (string, datetime or date) to day ordinal, i.e. number of days since 1970-01-01."""
+    return pd.Timestamp(date).value // NS_PER_DAY
+
+
+def to_shifted_day(date, n_days, direction):
+    """Shifts date by n_days and converts it to the day ordinal of the first (after) or last (before) full day.
+    Price dates are midnight timestamps, so a shifted date with a time part is rounded up for direction 'after'.
+    """
+    ns = (pd.Timestamp(date) + pd.DateOffset(days=n_days)).value
+    if direction == 'before':
+        return ns // NS_PER_DAY
+    elif direction == 'after':
+        return -(-ns // NS_PER_DAY)
+    else:
+        raise ValueError('direction must be either before or after')
+
+
+def to_shifted_days(dates, n_days, direction):
+    """Vectorized to_shifted_day for an array of datetime64 values. Returns day ordinals and mask of non-NaT values."""
+    dates = np.asarray(dates, dtype='datetime64[ns]')
+    valid = ~np.isnat(dates)
+    ns = dates.astype(np.int64) + n_days * NS_PER_DAY
+    if direction == 'before':
+        return ns // NS_PER_DAY, valid
+    elif direction == 'after':
+        return -(-ns // NS_PER_DAY), valid
+    else:
+        raise ValueError('direction must be either before or after')
+
+
+def get_csv_path(ticker):
+    return f'{const.FLD_SHARE_PRICES}/{ticker}.csv'
+
+
+def get_bin_path(ticker):
+    return f'{const.FLD_SHARE_PRICES_BIN}/{ticker}.npy'
+
+
+def build_ticker_prices(ticker):
+    """Converts csv share price history of ticker into the binary format and saves it.
+    Returns None if the csv file does not exist, empty array if it has no Date or Close column.
+    """
+    try:
+        history = pd.read_csv(get_csv_path(ticker))
+    except FileNotFoundError:
+        return None
+    profiling.count_file_read(get_csv_path(ticker))
+
+    if ('Date' in history.columns) and ('Close' in history.columns):
+        history = history.sort_values('Date', kind='stable')
+        prices = np.empty(history.shape[0], dtype=PRICE_DTYPE)
+        prices['day'] = pd.to_datetime(history['Date']).to_numpy().astype('datetime64[D]').astype(np.int64)
+        prices['close'] = history['Close'].to_numpy(dtype=float)
+    else:
+        prices = np.empty(0, dtype=PRICE_DTYPE)
+
+    # write to temporary file first, so that concurrent readers never see partial file
+    utils.maybe_make_dir(const.FLD_SHARE_PRICES_BIN)
+    path_tmp = f'{get_bin_path(ticker)}.{os.getpid()}.tmp'
+    with open(path_tmp, 'wb') as f:
+        np.save(f, prices)
+    os.replace(path_tmp, get_bin_path(ticker))
+
+    return prices
+
+
+def build_price_store(tickers):
+    """Converts csv share price histories of all tickers into the binary format."""
+    for ticker in tickers:
+        build_ticker_prices(ticker)
+    return None
+
+
+class PriceStore:
+    """Memory-mapped share price histories with as-of lookups. Histories are loaded once per ticker."""
+
+    def __init__(self):
+        self._prices = {}
+
+    def get(self, ticker):
+        """Returns price records of ticker (None if there is no history). Outdated binary files are rebuilt."""
+        if ticker not in self._prices:
+            self._prices[ticker] = self._load(ticker)
+        return self._prices[ticker]
+
+    @staticmethod
+    @profiling.timed('io.load_prices')
+    def _load(ticker):
+        path_csv, path_bin = get_csv_path(ticker), get_bin_path(ticker)
+        if not os.path.exists(path_csv):
+            return None
+        if (not os.path.exists(path_bin)) or (os.path.getmtime(path_bin) < os.path.getmtime(path_csv)):
+            build_ticker_prices(ticker)
+        try:
+            profiling.count_file_read(path_bin)
+            return np.load(path_bin, mmap_mode='r')
+        except ValueError:
+            # empty histories can not be memory-mapped
+            return np.load(path_bin)
+
+    def invalidate(self, ticker):
+        """Drops cached history of ticker, e.g. after its csv file was re-downloaded."""
+        self._prices.pop(ticker, None)
+
+    def clear(self):
+        self._prices.clear()
+
+    def get_price(self, ticker, date, direction='before', n_days=0):
+        """Gets the last close on or before (or the first close on or after) date shifted by n_days."""
+        day = to_shifted_day(date, n_days, direction)
+        prices = self.get(ticker)
+        if prices is None or prices.shape[0] == 0:
+            return np.nan
+
+        if direction == 'before':
+            idx = np.searchsorted(prices['day'], day, side='right') - 1
+            return prices['close'][idx] if idx >= 0 else np.nan
+        else:
+            idx = np.searchsorted(prices['day'], day, side='left')
+            return prices['close'][idx] if idx < prices.shape[0] else np.nan
+
+    def get_prices(self, ticker, dates, direction='before', n_days=0):
+        """Vectorized get_price for an array of dates of a single ticker."""
+        days, valid = to_shifted_days(dates, n_days, direction)
+        res = np.full(days.shape[0], np.nan)
+        prices = self.get(ticker)
+        if prices is None or prices.shape[0] == 0:
+            return res
+
+        if direction == 'before':
+            idx = np.searchsorted(prices['day'], days, side='right') - 1
+            found = valid & (idx >= 0)
+        else:
+            idx = np.searchsorted(prices['day'], days, side='left')
+            found = valid & (idx < prices.shape[0])
+        res[found] = prices['close'][idx[found]]
+        return res
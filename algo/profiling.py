@@ -0,0 +1,107 @@
+"""
+This module contains opt-in profiling of valuation runs: stage timers, I/O counters and solver counters.
+Profiling is enabled by environment variable ALGO_PROFILE=1 (const.PROFILE), read once at import.
+When disabled, decorated functions are left unwrapped and counting is a single flag check.
+Timers measure self time, i.e. time spent in nested stages is attributed to the nested stage only.
+Aggregates of a run are written as JSON report (see runner.run_valuation).
+"""
+
+import functools
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+import algo.constants as const
+
+ENABLED = const.PROFILE
+
+# stage name -> [calls, self seconds, total seconds]
+_timers = defaultdict(lambda: [0, 0.0, 0.0])
+# counter name -> value
+_counters = defaultdict(int)
+# stack of running stages, each [name, start, seconds spent in nested stages]
+_stack = []
+
+
+@contextmanager
+def stage(name):
+    """Times the enclosed block as stage name."""
+    frame = [name, time.perf_counter(), 0.0]
+    _stack.append(frame)
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - frame[1]
+        _stack.pop()
+        if len(_stack) > 0:
+            _stack[-1][2] += elapsed
+        timer = _timers[name]
+        timer[0] += 1
+        timer[1] += elapsed - frame[2]
+        timer[2] += elapsed
+
+
+def timed(name):
+    """Decorator timing each call of the function as stage name. No-op if profiling is disabled."""
+    def decorate(func):
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name, n=1):
+    """Increments counter name by n."""
+    if ENABLED:
+        _counters[name] += n
+
+
+def count_file_read(path):
+    """Counts opening of the file and its size as bytes read.
+    Memory-mapped files are counted with their full size, although only touched pages are read.
+    """
+    if ENABLED:
+        _counters['io.file_opens'] += 1
+        _counters['io.bytes_read'] += os.path.getsize(path)
+
+
+def reset():
+    _timers.clear()
+    _counters.clear()
+    return None
+
+
+def get_report():
+    """Returns aggregates collected since the last reset as dictionary."""
+    return {
+        'timers': {name: {'calls': calls, 'self_seconds': self_seconds, 'total_seconds': total_seconds}
+                   for name, (calls, self_seconds, total_seconds) in sorted(_timers.items())},
+        'counters': dict(sorted(_counters.items())),
+    }
+
+
+def merge_reports(reports):
+    """Sums reports, e.g. of shards valued in worker processes."""
+    timers = defaultdict(lambda: {'calls': 0, 'self_seconds': 0.0, 'total_seconds': 0.0})
+    counters = defaultdict(int)
+    for report in reports:
+        for name, timer in report['timers'].items():
+            for key, value in timer.items():
+                timers[name][key] += value
+        for name, value in report['counters'].items():
+            counters[name] += value
+    return {'timers': dict(sorted(timers.items())), 'counters': dict(sorted(counters.items()))}
+
+
+def write_report(report, path=const.PATH_PROFILE_REPORT):
+    """Writes report as JSON file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    return None
@@ -0,0 +1,84 @@
+"""
+This module contains a columnar buffer for accumulating result rows.
+Each column is a preallocated NumPy array that grows geometrically, so appending a row is amortized O(1).
+The buffer is converted to a DataFrame or an Arrow table only when results are written.
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+INTRINSIC_VALUE_COLUMNS = {
+    'ticker': object,
+    'date': object,
+    'intrinsic_value': float,
+    'share_price': float,
+    'error_message': object,
+}
+
+IMPLIED_PERP_G_RATE_COLUMNS = {
+    'ticker': object,
+    'date': object,
+    'implied_perp_g_rate': float,
+}
+
+
+class ResultBuffer:
+    """Typed columnar buffer of result rows. Parameter columns maps column names to dtypes."""
+
+    def __init__(self, columns, capacity=64):
+        self.columns = dict(columns)
+        self._data = {name: np.empty(capacity, dtype=dtype) for name, dtype in self.columns.items()}
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def capacity(self):
+        return next(iter(self._data.values())).shape[0]
+
+    def _reserve(self, size):
+        """Makes sure the buffer can hold size rows, doubling the capacity as needed."""
+        if size <= self.capacity:
+            return
+        capacity = max(self.capacity, 1)
+        while capacity < size:
+            capacity *= 2
+        for name, arr in self._data.items():
+            grown = np.empty(capacity, dtype=arr.dtype)
+            grown[:self._size] = arr[:self._size]
+            self._data[name] = grown
+
+    def append(self, *row):
+        """Appends a single row, values are in the order of columns."""
+        if len(row) != len(self.columns):
+            raise ValueError(f'Expected {len(self.columns)} values, got {len(row)}')
+        self._reserve(self._size + 1)
+        for arr, value in zip(self._data.values(), row):
+            arr[self._size] = value
+        self._size += 1
+        return self
+
+    def extend(self, data):
+        """Appends many rows given as dictionary of columns (sequences of equal length)."""
+        n_rows = len(next(iter(data.values()))) if len(data) > 0 else 0
+        self._reserve(self._size + n_rows)
+        for name, arr in self._data.items():
+            arr[self._size:self._size + n_rows] = data[name]
+        self._size += n_rows
+        return self
+
+    def to_dict(self):
+        """Returns dictionary of column arrays (copies trimmed to the number of rows)."""
+        return {name: arr[:self._size].copy() for name, arr in self._data.items()}
+
+    def to_frame(self):
+        return pd.DataFrame(self.to_dict(), columns=list(self.columns))
+
+    def to_arrow(self):
+        return pa.table(self.to_dict())
+
+    def clear(self):
+        self._size = 0
+        return self
@@ -0,0 +1,127 @@
+"""
+This module contains the results store, a SQLite database in WAL mode.
+Results tables have primary key (ticker, date), each upsert of a batch of rows runs in a single transaction.
+Existing csv results are imported on the first use of an empty table.
+"""
+
+import os
+import sqlite3
+import pandas as pd
+import algo.constants as const
+
+TABLE_INTRINSIC_VALUES = 'intrinsic_values'
+TABLE_IMPLIED_PERP_G_RATES = 'implied_perp_growth_rates'
+
+TABLES = {
+    TABLE_INTRINSIC_VALUES: {
+        'columns': {
+            'ticker': 'TEXT NOT NULL',
+            'date': 'TEXT NOT NULL',
+            'intrinsic_value': 'REAL',
+            'share_price': 'REAL',
+            'error_message': 'TEXT',
+            'input_fingerprint': 'TEXT',
+            'created': 'TEXT',
+        },
+        'legacy_csv': const.PATH_RESULTS_INTRINSIC_VALUES,
+    },
+    TABLE_IMPLIED_PERP_G_RATES: {
+        'columns': {
+            'ticker': 'TEXT NOT NULL',
+            'date': 'TEXT NOT NULL',
+            'implied_perp_g_rate': 'REAL',
+            'input_fingerprint': 'TEXT',
+            'created': 'TEXT',
+        },
+        'legacy_csv': const.PATH_IMPLIED_PERP_G_RATES,
+    },
+}
+KEY_COLUMNS = ['ticker', 'date']
+
+
+def connect(path=const.PATH_RESULTS_DB):
+    """Opens the results database, creating missing tables."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=60)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+
+    for table, spec in TABLES.items():
+        columns = ', '.join(f'{col} {sql_type}' for col, sql_type in spec['columns'].items())
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {table} ({columns}, PRIMARY KEY ({", ".join(KEY_COLUMNS)}))')
+
+        # add columns missing in databases created by older versions
+        existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+        for col, sql_type in spec['columns'].items():
+            if col not in existing:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN {col} {sql_type}')
+    conn.commit()
+
+    for table, spec in TABLES.items():
+        if os.path.exists(spec['legacy_csv']) and \
+                conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] == 0:
+            _upsert(conn, table, pd.read_csv(spec['legacy_csv']))
+
+    return conn
+
+
+def _upsert(conn, table, df):
+    """Upserts df rows into table in a single transaction."""
+    columns = list(TABLES[table]['columns'].keys())
+    df = df.reindex(columns=columns).astype(object)
+    df = df.where(df.notna(), None)
+
+    updates = ', '.join(f'{col} = excluded.{col}' for col in columns if col not in KEY_COLUMNS)
+    sql = (f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))}) '
+           f'ON CONFLICT ({", ".join(KEY_COLUMNS)}) DO UPDATE SET {updates}')
+
+    with conn:
+        conn.executemany(sql, df.itertuples(index=False, name=None))
+    return None
+
+
+def upsert(table, df, add_created=True, path=const.PATH_RESULTS_DB):
+    """Upserts results into table. Rows with existing (ticker, date) are replaced."""
+    if df.shape[0] == 0:
+        return None
+
+    df = df.copy()
+    if add_created:
+        df['created'] = pd.Timestamp.now().strftime(format='%Y-%m-%d %H:%M:%S')
+    df['date'] = df['date'].astype(str)
+
+    conn = connect(path)
+    try:
+        _upsert(conn, table, df)
+    finally:
+        conn.close()
+    return None
+
+
+def read(table, tickers=None, path=const.PATH_RESULTS_DB):
+    """Reads results from table, optionally only for given tickers."""
+    conn = connect(path)
+    try:
+        if tickers is None:
+            return pd.read_sql(f'SELECT * FROM {table} ORDER BY ticker, date', conn)
+        tickers = list(tickers)
+        return pd.read_sql(f'SELECT * FROM {table} WHERE ticker IN ({", ".join("?" * len(tickers))}) '
+                           f'ORDER BY ticker, date', conn, params=tickers)
+    finally:
+        conn.close()
+
+
+def read_fingerprints(table, tickers=None):
+    """Returns dictionary mapping (ticker, date) to the input fingerprint stored with the result."""
+    res = read(table, tickers)
+    return dict(zip(zip(res['ticker'], res['date']), res['input_fingerprint']))
+
+
+def read_intrinsic_values(tickers=None):
+    return read(TABLE_INTRINSIC_VALUES, tickers)
+
+
+def read_implied_perp_g_rates(tickers=None):
+    """Reads implied perpetual growth rates, rows without root (stored for their input fingerprints) are dropped."""
+    res = read(TABLE_IMPLIED_PERP_G_RATES, tickers)
+    return res.loc[res['implied_perp_g_rate'].notna(), :].reset_index(drop=True)
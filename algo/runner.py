@@ -0,0 +1,128 @@
+"""
+This module runs the valuation of tickers in parallel worker processes.
+Tickers are sharded across workers, each worker returns columnar results and the main process is the only writer.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import numpy as np
+import pandas as pd
+import algo.batch_modelling as batch
+import algo.constants as const
+import algo.data_acquisition as da
+import algo.fingerprints as fingerprints
+import algo.modelling as model
+import algo.profiling as profiling
+import algo.results_store as results_store
+from algo.result_buffer import ResultBuffer, INTRINSIC_VALUE_COLUMNS, IMPLIED_PERP_G_RATE_COLUMNS
+
+
+def value_tickers(tickers, optimize_perp_g_rate=False, use_batch_engine=False, stored_fingerprints=None):
+    """Runs valuation of a shard of tickers in the current process.
+    Rows whose input fingerprint equals the one in stored_fingerprints[(ticker, date)] are skipped (before they are
+    solved in the batch engine).
+    Returns results as dictionary of column arrays, the number of skipped rows and profiling report of the shard
+    (None if profiling is disabled).
+    """
+    profiling.reset()
+    stored_fingerprints = {} if stored_fingerprints is None else stored_fingerprints
+    columns = IMPLIED_PERP_G_RATE_COLUMNS if optimize_perp_g_rate else INTRINSIC_VALUE_COLUMNS
+    results = ResultBuffer(columns)
+    input_fingerprints = []
+    n_skipped = 0
+
+    if use_batch_engine:
+        if optimize_perp_g_rate:
+            batch_results, n_skipped = batch.run_implied_perp_g_rates(tickers, stored_fingerprints=stored_fingerprints)
+        else:
+            batch_results, n_skipped = batch.run_intrinsic_values(tickers, stored_fingerprints=stored_fingerprints)
+        results.extend({col: batch_results[col].to_numpy() for col in columns})
+        input_fingerprints = batch_results['input_fingerprint'].to_list()
+
+    else:
+        betas = da.get_betas()
+        for ticker in tickers:
+            print(ticker)
+
+            # get all dates for the ticker and fingerprints of their inputs
+            dates = da.get_ticker_dates(ticker)
+            inputs = fingerprints.collect_inputs(ticker, dates, with_perp_growth_rate=not optimize_perp_g_rate,
+                                                 betas=betas)
+
+            for date, fingerprint in zip(dates, fingerprints.get_input_fingerprints(inputs)):
+                if stored_fingerprints.get((ticker, date)) == fingerprint:
+                    n_skipped += 1
+                    continue
+
+                n_rows = len(results)
+                if optimize_perp_g_rate:
+                    model.get_optimized_perp_g_rate(ticker, date, results)
+                    # rows without root are stored as NaN, so that they are skipped while their inputs are unchanged
+                    if len(results) == n_rows:
+                        results.append(ticker, date, np.nan)
+                else:
+                    model.get_intrinsic_value_wrapper(ticker, date, results)
+                if len(results) > n_rows:
+                    input_fingerprints.append(fingerprint)
+
+    res = results.to_dict()
+    res['input_fingerprint'] = np.array(input_fingerprints, dtype=object)
+    return res, n_skipped, profiling.get_report() if profiling.ENABLED else None
+
+
+def shard_tickers(tickers, n_shards):
+    """Splits tickers into n_shards contiguous shards of similar size, keeping their order."""
+    n_shards = max(1, min(n_shards, len(tickers)))
+    return [list(shard) for shard in np.array_split(np.array(tickers, dtype=object), n_shards)]
+
+
+def write_results(results, optimize_perp_g_rate):
+    """Upserts columnar results of one shard into the results store in a single transaction."""
+    table = results_store.TABLE_IMPLIED_PERP_G_RATES if optimize_perp_g_rate else results_store.TABLE_INTRINSIC_VALUES
+    results_store.upsert(table, pd.DataFrame(results))
+    return None
+
+
+def run_valuation(tickers, optimize_perp_g_rate=False, use_batch_engine=False, n_workers=const.N_WORKERS,
+                  recompute_all=False):
+    """Runs valuation of tickers in n_workers processes and writes results.
+    Only rows whose inputs changed since the stored result are recomputed, unless recompute_all is True.
+    Shards are written in submission order, so the output does not depend on the order in which workers finish.
+    If profiling is enabled, reports of all shards are summed and written to const.PATH_PROFILE_REPORT.
+    Returns number of written and skipped rows.
+    """
+    shards = shard_tickers(tickers, n_workers * const.N_SHARDS_PER_WORKER)
+
+    # stored fingerprints, split by shard
+    table = results_store.TABLE_IMPLIED_PERP_G_RATES if optimize_perp_g_rate else results_store.TABLE_INTRINSIC_VALUES
+    stored = {} if recompute_all else results_store.read_fingerprints(table, tickers)
+    shard_idx = {ticker: idx for idx, shard in enumerate(shards) for ticker in shard}
+    stored_shards = [{} for _ in shards]
+    for key, val in stored.items():
+        if key[0] in shard_idx:
+            stored_shards[shard_idx[key[0]]][key] = val
+
+    n_written, n_skipped = 0, 0
+    reports = []
+    if n_workers == 1:
+        shard_results = (value_tickers(shard, optimize_perp_g_rate, use_batch_engine, stored_shard)
+                         for shard, stored_shard in zip(shards, stored_shards))
+        for results, n_skipped_shard, report in shard_results:
+            write_results(results, optimize_perp_g_rate)
+            n_written += len(results['ticker'])
+            n_skipped += n_skipped_shard
+            reports.append(report)
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            for results, n_skipped_shard, report in executor.map(value_tickers, shards, repeat(optimize_perp_g_rate),
+                                                                 repeat(use_batch_engine), stored_shards):
+                write_results(results, optimize_perp_g_rate)
+                n_written += len(results['ticker'])
+                n_skipped += n_skipped_shard
+                reports.append(report)
+
+    print(f'written {n_written} rows, skipped {n_skipped} rows with unchanged inputs')
+    if profiling.ENABLED:
+        profiling.write_report(profiling.merge_reports(reports))
+        print(f'profiling report written to {const.PATH_PROFILE_REPORT}')
+    return n_written, n_skipped
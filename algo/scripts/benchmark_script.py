@@ -0,0 +1,49 @@
+"""
+This script benchmarks the valuation and SEC data processing hot paths on synthetic data.
+Synthetic data are generated into a temporary folder (see algo.synthetic_data), network is never accessed.
+Run it from the repository root, results are compared with baselines in 'benchmarks/baselines.json'.
+Set save_baselines to True to record new baselines (e.g. after an intended performance change).
+"""
+import os
+
+os.environ['ALGO_OFFLINE'] = '1'
+
+import tempfile
+import algo.benchmarks as benchmarks
+import algo.constants as const
+import algo.synthetic_data as synthetic_data
+
+# scale of synthetic data
+scale = {'n_tickers': 50, 'n_filler_concepts': 100, 'n_noise_companies': 200, 'seed': 0}
+
+# benchmarks to run (None for all, see benchmarks.BENCHMARKS)
+names = None
+# names = ['get_single_observation', 'get_intrinsic_value']
+
+# number of runs of each benchmark, the fastest one is reported
+repeat = 3
+
+# record results as new baselines
+save_baselines = False
+
+# fail if benchmark is slower than baseline by more than tolerance
+tolerance = 0.2
+
+if __name__ == '__main__':
+    path_baselines = os.path.abspath(const.PATH_BENCHMARK_BASELINES)
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as root:
+        tickers = synthetic_data.generate(root, **scale)
+        os.chdir(root)
+        try:
+            benchmarks.prepare(tickers)
+            results = benchmarks.run_benchmarks(tickers, names=names, repeat=repeat)
+        finally:
+            os.chdir(cwd)
+
+    regressions = benchmarks.compare_with_baselines(results, scale, tolerance=tolerance, path=path_baselines)
+    if save_baselines:
+        benchmarks.save_baselines(results, scale, path=path_baselines)
+    elif len(regressions) > 0:
+        raise SystemExit(f'benchmarks slower than baseline: {", ".join(regressions)}')
@@ -8,9 +8,11 @@ import algo.data_acquisition as da
 available_tickers = da.get_available_tickers()
 available_tickers = ['MAAI']
 
+# only days since the last stored date are downloaded, histories adjusted for splits or dividends are reloaded
 download_share_prices = False
 if download_share_prices:
-    da.download_all_share_prices(available_tickers)
+    failed = da.download_all_share_prices(available_tickers)
+    print(f'share prices failed for: {sorted(failed)}')
 
 # shares outstanding are now taken from SEC rather than from yfinance
 # download_shares_outstanding = False
@@ -19,7 +21,8 @@ if download_share_prices:
 
 download_betas = False
 if download_betas:
-    da.download_all_betas(available_tickers)
+    failed = da.download_all_betas(available_tickers)
+    print(f'betas failed for: {sorted(failed)}')
 
 download_sp500_returns = False
 if download_sp500_returns:
@@ -6,10 +6,12 @@ It is used as the default growth rate
 import numpy as np
 import pandas as pd
 import algo.constants as const
+import algo.results_store as results_store
+import algo.utils as utils
 
 
 # load growth rate results
-implied_rates = pd.read_csv(const.PATH_IMPLIED_PERP_G_RATES)
+implied_rates = results_store.read_implied_perp_g_rates()
 
 # take only after 2020
 # implied_rates = implied_rates[implied_rates['date'] >= '2020-01-01']
@@ -28,5 +30,6 @@ implied_rates_p50 = implied_rates.groupby('year')['implied_perp_g_rate'].quantil
 implied_rates_p50 = implied_rates_p50.reset_index()
 
 # save to csv
+utils.maybe_make_dir(const.FLD_IMPLIED_PERP_G_RATES)
 implied_rates_p50.to_csv(const.PATH_IMPLIED_PERP_G_RATES_P50, index=False)
 
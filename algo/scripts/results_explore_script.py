@@ -14,10 +14,11 @@ reload(da)
 import algo.constants as const
 reload(const)
 import algo.utils as utils
+import algo.results_store as results_store
 import algo.modelling as model
 reload(model)
 
-results_raw = pd.read_csv(const.PATH_RESULTS_INTRINSIC_VALUES)
+results_raw = results_store.read_intrinsic_values()
 results = results_raw[['ticker', 'date', 'intrinsic_value', 'share_price']].copy()
 results = results.replace([np.inf, -np.inf], np.nan)
 results = results.dropna()
@@ -103,13 +104,8 @@ acc_dates = acc_dates[~acc_dates['share_price_1d'].isnull()]
 
 merged = acc_dates.merge(results, on=['ticker', 'date'], how='inner')
 
-# get price 100 after
-merged['share_price_100d'] = merged.apply(
-    lambda x: da.get_share_price_around_date(x['ticker'], x['accepted'], direction='after', n_days=100), axis=1)
-
-# get price 365 after
-merged['share_price_365d'] = merged.apply(
-    lambda x: da.get_share_price_around_date(x['ticker'], x['accepted'], direction='after', n_days=365), axis=1)
+# get price 100 and 365 days after
+merged = da.get_share_prices_around_dates(merged, offsets=[100, 365])
 
 # filter only rows where intrinsic value is either larger or smaller than share price share_price_1d
 higher_intrinsic = merged.loc[merged['intrinsic_value'] > merged['share_price_1d'], :].copy()
@@ -305,7 +301,7 @@ n_companied_dates['n_dates'].sum()
 # AVERAGE PERPETUITY GROWTH RATE IN EACH YEAR
 
 # load implied perpetual growth rates
-implied_perp_g_rates = pd.read_csv(const.PATH_IMPLIED_PERP_G_RATES)
+implied_perp_g_rates = results_store.read_implied_perp_g_rates()
 
 # add year column
 implied_perp_g_rates['year'] = pd.to_datetime(implied_perp_g_rates['date']).dt.year
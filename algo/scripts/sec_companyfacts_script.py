@@ -0,0 +1,22 @@
+"""
+Purpose of this script is to ingest SEC XBRL company facts, e.g. to get statements of filings which are not yet in the
+quarterly financial statement data sets processed by sec_data_processing_script.py.
+Steps:
+1. Download the companyfacts.zip bundle of all companies into 'data/sec_companyfacts' (or company facts of single
+   companies from the XBRL API).
+2. Statements of S&P 500 companies are normalized, those with dates after the last stored date of each ticker are
+   added to the parquet dataset in 'data/sec_statements_parquet'.
+Processing steps are implemented in algo.sec_companyfacts.
+"""
+import algo.sec_companyfacts as sec_companyfacts
+
+download_bundle = True
+if download_bundle:
+    sec_companyfacts.download_companyfacts_bundle()
+
+# download company facts of single companies instead of the bundle
+# import algo.sec_processing as sec_processing
+# sec_companies, cik_sp500 = sec_processing.load_universe()
+# sec_companyfacts.download_companyfacts(cik_sp500)
+
+statements = sec_companyfacts.ingest_companyfacts()
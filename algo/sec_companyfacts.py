@@ -0,0 +1,236 @@
+"""
+This module contains the bulk ingest of SEC XBRL company facts, used by sec_companyfacts_script.py.
+It is a source of statements for recent filings, which are not yet in the quarterly financial statement data sets
+(see algo.sec_processing), without one XBRL API request per ticker and concept.
+Company facts of all companies come as a single companyfacts.zip bundle of CIK{cik}.json files, facts of single
+companies can be downloaded from the XBRL API into files of the same name in const.FLD_COMPANYFACTS.
+Files of S&P 500 companies are selected by their names, other companies are never parsed. Files are parsed in parallel
+worker processes, each reading its files one at a time directly from the bundle.
+Facts are normalized into the statement schema: 10-K facts of annual duration (or instants) are kept, the latest filed
+value of each ticker, date and concept is used and statements are filtered the same way as in Part 2 of the ingest of
+the quarterly data sets. Accepted dates are the filing dates, company facts do not have acceptance times.
+Only statement dates after the last stored date of each ticker are added to the statements dataset. Stored statements
+are never replaced, so that they keep the values and accepted dates known at the time (company facts hold the latest
+restated values).
+"""
+
+import glob
+import json
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from email.utils import formatdate
+from itertools import repeat
+import numpy as np
+import pandas as pd
+import algo.constants as const
+import algo.data_acquisition as da
+import algo.downloader as downloader
+import algo.fundamentals as fundamentals
+import algo.http_client as http_client
+import algo.sec_processing as sec_processing
+import algo.utils as utils
+
+# duration facts are kept if they span a fiscal year
+ANNUAL_DURATION_DAYS = (300, 400)
+
+STATEMENT_COLUMNS = ['adsh', 'date', 'accepted', 'ticker', 'cik', 'concept', 'source_yq', 'val']
+
+
+def get_file_name(cik):
+    return f'CIK{int(cik):010d}.json'
+
+
+def download_companyfacts_bundle():
+    """Downloads the companyfacts.zip bundle of all companies, unless the stored one is up to date.
+    The bundle is streamed to a temporary file, so that it is never held in memory or left partially written.
+    """
+    if const.OFFLINE:
+        raise RuntimeError('SEC company facts can not be downloaded in offline mode')
+
+    headers = dict(const.SEC_HEADERS)
+    if os.path.exists(const.PATH_COMPANYFACTS_BUNDLE):
+        headers['If-Modified-Since'] = formatdate(os.path.getmtime(const.PATH_COMPANYFACTS_BUNDLE), usegmt=True)
+
+    with http_client.get_session().get(const.URL_SEC_COMPANYFACTS_BULK, headers=headers, stream=True,
+                                       timeout=const.DOWNLOAD_TIMEOUT_SECONDS) as response:
+        if response.status_code == 304:
+            print('company facts bundle is up to date')
+            return None
+        response.raise_for_status()
+
+        utils.maybe_make_dir(const.FLD_COMPANYFACTS)
+        path_tmp = f'{const.PATH_COMPANYFACTS_BUNDLE}.{os.getpid()}.tmp'
+        with open(path_tmp, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=8 * 1024 ** 2):
+                f.write(chunk)
+        os.replace(path_tmp, const.PATH_COMPANYFACTS_BUNDLE)
+    return None
+
+
+def download_ticker_companyfacts(cik, slot=None):
+    """Downloads company facts of cik from the XBRL API and writes them atomically.
+    Parameter slot is passed to algo.http_client.get.
+    """
+    response = http_client.get(f'{const.URL_SEC_DATA}/api/xbrl/companyfacts/{get_file_name(cik)}',
+                               headers=const.SEC_HEADERS, slot=slot)
+    downloader.raise_for_status(response)
+
+    utils.maybe_make_dir(const.FLD_COMPANYFACTS)
+    path = os.path.join(const.FLD_COMPANYFACTS, get_file_name(cik))
+    path_tmp = f'{path}.{os.getpid()}.tmp'
+    with open(path_tmp, 'wb') as f:
+        f.write(response.content)
+    os.replace(path_tmp, path)
+    return None
+
+
+def download_companyfacts(ciks, engine=None):
+    """Downloads company facts of ciks concurrently (see algo.downloader), e.g. instead of the whole bundle.
+    Returns dictionary of errors of failed ciks.
+    """
+    engine = downloader.Downloader() if engine is None else engine
+    _, errors = engine.run(ciks, downloader.get_host(const.URL_SEC_DATA),
+                           lambda cik: download_ticker_companyfacts(cik, slot=engine.slot), throttle=False)
+    return errors
+
+
+def get_source():
+    """Returns the bundle if it exists, otherwise the folder with per-company files."""
+    return const.PATH_COMPANYFACTS_BUNDLE if os.path.exists(const.PATH_COMPANYFACTS_BUNDLE) else const.FLD_COMPANYFACTS
+
+
+def list_files(source):
+    """Returns names of company facts files in source (bundle or folder)."""
+    if source.endswith('.zip'):
+        with zipfile.ZipFile(source) as archive:
+            return archive.namelist()
+    return [os.path.basename(path) for path in glob.glob(os.path.join(source, 'CIK*.json'))]
+
+
+def normalize_facts(facts, cik, tickers, concepts=None):
+    """Normalizes company facts of cik into statement rows of each of tickers (tickers sharing the cik).
+    Returns statement rows with filing date (only concepts if given) and (ticker, date, concept) keys of all concepts.
+    """
+    rows = []
+    for taxonomy in facts.get('facts', {}).values():
+        for concept, fact in taxonomy.items():
+            for entries in fact.get('units', {}).values():
+                for entry in entries:
+                    if entry.get('form') == '10-K':
+                        rows.append((entry['accn'], entry.get('start'), entry['end'], entry['filed'], concept,
+                                     entry['val']))
+
+    df = pd.DataFrame(rows, columns=['adsh', 'start', 'date', 'filed', 'concept', 'val'])
+    df['date'] = pd.to_datetime(df['date'])
+    df['filed'] = pd.to_datetime(df['filed'])
+    df['val'] = df['val'].astype(float)
+
+    # keep instants and facts of annual duration
+    days = (df['date'] - pd.to_datetime(df['start'])).dt.days
+    df = df.loc[df['start'].isna() | days.between(*ANNUAL_DURATION_DAYS), :].drop(columns=['start'])
+    df['cik'] = int(cik)
+
+    df = pd.concat([df.assign(ticker=ticker) for ticker in tickers], ignore_index=True)
+    keys = df.loc[:, ['ticker', 'date', 'concept']].drop_duplicates()
+    if concepts is not None:
+        df = df.loc[df['concept'].isin(concepts), :]
+    return df, keys
+
+
+def read_files(source, names, cik_tickers, concepts=None):
+    """Reads and normalizes company facts files names of source (see normalize_facts), one file at a time."""
+    rows_list, keys_list = [], []
+    archive = zipfile.ZipFile(source) if source.endswith('.zip') else None
+    try:
+        for name in names:
+            cik = int(name[3:13])
+            if archive is not None:
+                with archive.open(name) as f:
+                    facts = json.load(f)
+            else:
+                with open(os.path.join(source, name)) as f:
+                    facts = json.load(f)
+            rows, keys = normalize_facts(facts, cik, cik_tickers[cik], concepts)
+            rows_list.append(rows)
+            keys_list.append(keys)
+    finally:
+        if archive is not None:
+            archive.close()
+    return pd.concat(rows_list, ignore_index=True), pd.concat(keys_list, ignore_index=True)
+
+
+def build_statements(rows, keys=None):
+    """Builds statements from normalized rows, keeping the latest filed value for each ticker, date and concept.
+    Parameter keys holds (ticker, date, concept) keys of all concepts if concepts were whitelisted.
+    """
+    rows = rows.sort_values(['ticker', 'date', 'concept', 'filed', 'adsh'], kind='stable')
+    rows = rows.drop_duplicates(subset=['ticker', 'date', 'concept'], keep='last')
+    rows['accepted'] = rows['filed']
+    rows['source_yq'] = rows['filed'].dt.year.astype(str) + 'q' + rows['filed'].dt.quarter.astype(str)
+    return sec_processing.filter_statements(rows.loc[:, STATEMENT_COLUMNS], keys)
+
+
+def read_companyfacts(source=None, concept_set=const.INGEST_CONCEPT_SET, n_workers=const.N_WORKERS):
+    """Reads company facts of S&P 500 companies from source (bundle or folder, see get_source) in n_workers processes.
+    Returns statements and the list of tickers with company facts (None, None if there are none).
+    """
+    source = get_source() if source is None else source
+    sec_companies, cik_sp500 = sec_processing.load_universe()
+    universe = sec_companies.loc[sec_companies['cik_num'].isin(cik_sp500), :]
+    cik_tickers = universe.groupby('cik_num')['ticker'].apply(list).to_dict()
+
+    # only files of S&P 500 companies are parsed
+    names = sorted(name for name in list_files(source)
+                   if name.startswith('CIK') and name.endswith('.json') and name[3:13].isdigit()
+                   and int(name[3:13]) in cik_tickers)
+    if len(names) == 0:
+        print(f'no company facts of S&P 500 companies in {source}')
+        return None, None
+    print(f'reading company facts of {len(names)} companies')
+
+    concepts = const.INGEST_CONCEPT_SETS[concept_set]
+    chunks = [list(chunk) for chunk in np.array_split(names, min(len(names), n_workers * 4))]
+    if n_workers == 1:
+        results = list(map(read_files, repeat(source), chunks, repeat(cik_tickers), repeat(concepts)))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(read_files, repeat(source), chunks, repeat(cik_tickers), repeat(concepts)))
+
+    rows = pd.concat([rows for rows, _ in results], ignore_index=True)
+    keys = None
+    if concepts is not None:
+        keys = pd.concat([keys for _, keys in results], ignore_index=True).drop_duplicates()
+
+    tickers = sorted({ticker for name in names for ticker in cik_tickers[int(name[3:13])]})
+    return build_statements(rows, keys), tickers
+
+
+def get_new_statements(statements):
+    """Returns statements with dates after the last date of their ticker in the statements dataset."""
+    if not os.path.isdir(const.FLD_STATEMENTS_DATASET):
+        return statements
+    stored = da.read_statements(tickers=statements['ticker'].unique(), columns=['ticker', 'date'])
+    last_dates = pd.to_datetime(stored['date']).groupby(stored['ticker'].astype(str)).max()
+    last_date = statements['ticker'].map(last_dates)
+    return statements.loc[last_date.isna() | (statements['date'] > last_date), :]
+
+
+def ingest_companyfacts(source=None, concept_set=const.INGEST_CONCEPT_SET, n_workers=const.N_WORKERS):
+    """Ingests company facts (see read_companyfacts). Statements with dates after the last stored date of their ticker
+    are added to the statements dataset and the fundamentals matrix is rebuilt. Returns the added statements.
+    """
+    statements, _ = read_companyfacts(source, concept_set, n_workers)
+    if statements is None or statements.shape[0] == 0:
+        print('no statements in company facts')
+        return None
+
+    statements = get_new_statements(statements)
+    if statements.shape[0] == 0:
+        print('no statements after the last stored dates')
+        return None
+    print(f'adding {statements.shape[0]} statement values of {statements["ticker"].nunique()} tickers')
+
+    da.append_statements(statements)
+    fundamentals.build_fundamentals()
+    return statements
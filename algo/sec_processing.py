@@ -0,0 +1,492 @@
+"""
+This module contains functions processing SEC financial statement data sets, used by sec_data_processing_script.py.
+Part 1 extracts 10-K values of S&P 500 companies from the raw quarterly data. Quarters are processed in parallel
+worker processes, raw files are read by the multi-threaded pyarrow csv reader with explicit types and only the needed
+columns, values are filtered on adsh of the relevant submissions with a hash set lookup.
+Raw files are read from the extracted folder of the quarter if it exists, otherwise they are streamed directly
+from the original {yq}.zip archive without extracting it.
+Only concepts of const.INGEST_CONCEPT_SET are kept ('full' keeps all of them). Distinct (date, concept) keys of all
+concepts are saved separately, so that the completeness check of Part 2 counts the same concepts in every mode.
+Each quarter is saved as parquet files partitioned into const.N_STATEMENT_BUCKETS buckets of tickers.
+Part 2 reads one bucket of all quarters at a time, filters it in a single vectorized pass and writes the statements
+dataset.
+Accepted dates of the 10-K filings are collected in the same pass over the raw data as Part 1.
+The ingest (see ingest) keeps a manifest of ingested quarters with checksums of their raw files. Only new or changed
+quarters are extracted again, statements and accepted dates are then rebuilt only for tickers of those quarters and
+merged into the existing statements dataset and accepted dates file.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+import algo.constants as const
+import algo.data_acquisition as da
+import algo.fetched_data as fd
+import algo.fundamentals as fundamentals
+import algo.utils as utils
+
+
+# columns of the raw SEC files read by the ingest and their types
+SUB_COLUMNS = {
+    'adsh': pa.string(),
+    'cik': pa.int64(),
+    'form': pa.string(),
+    'period': pa.int64(),
+    'accepted': pa.string(),
+}
+NUM_COLUMNS = {
+    'adsh': pa.string(),
+    'tag': pa.string(),
+    'ddate': pa.string(),
+    'value': pa.float64(),
+}
+
+# size of blocks parsed by the csv reader
+CSV_BLOCK_SIZE = 64 * 1024 ** 2
+
+# schemas of extracted quarters
+QUARTER_SCHEMA = pa.schema([
+    ('adsh', pa.string()),
+    ('date', pa.timestamp('ns')),
+    ('accepted', pa.string()),
+    ('ticker', pa.string()),
+    ('cik', pa.int64()),
+    ('concept', pa.string()),
+    ('source_yq', pa.string()),
+    ('val', pa.float64()),
+    ('bucket', pa.int32()),
+])
+QUARTER_KEYS_SCHEMA = pa.schema([
+    ('ticker', pa.string()),
+    ('date', pa.timestamp('ns')),
+    ('concept', pa.string()),
+    ('bucket', pa.int32()),
+])
+QUARTER_ACCEPTED_DATES_SCHEMA = pa.schema([
+    ('ticker', pa.string()),
+    ('date', pa.timestamp('ns')),
+    ('accepted', pa.string()),
+    ('bucket', pa.int32()),
+])
+BUCKET_PARTITIONING = ds.partitioning(pa.schema([('bucket', pa.int32())]), flavor='hive')
+
+# folders of the extracted quarters
+QUARTER_FOLDERS = [const.FLD_STATEMENTS_QUARTERS, const.FLD_STATEMENTS_QUARTER_KEYS, const.FLD_ACCEPTED_DATES_QUARTERS]
+
+
+def get_raw_zip_path(yq):
+    return os.path.join(const.FLD_STATEMENTS_RAW, f'{yq}.zip')
+
+
+def get_raw_quarters():
+    """Returns sorted years/quarters available in the raw folder, either extracted or as {yq}.zip archive."""
+    if not os.path.isdir(const.FLD_STATEMENTS_RAW):
+        return []
+    matches = (re.fullmatch(r'(\d{4}q[1-4])(\.zip)?', name) for name in os.listdir(const.FLD_STATEMENTS_RAW))
+    return sorted({match.group(1) for match in matches if match is not None})
+
+
+def get_raw_paths(yq):
+    """Returns paths of raw files read for year/quarter yq (the extracted files if they exist, the archive otherwise)."""
+    paths = [os.path.join(const.FLD_STATEMENTS_RAW, yq, file) for file in ['sub.txt', 'num.txt']]
+    if all(os.path.exists(path) for path in paths) or not os.path.exists(get_raw_zip_path(yq)):
+        return paths
+    return [get_raw_zip_path(yq)]
+
+
+def open_raw_file(source, columns):
+    """Opens streaming reader of a raw SEC tab-separated file (path or file object), reading only columns with given
+    types."""
+    return pa_csv.open_csv(source,
+                           read_options=pa_csv.ReadOptions(use_threads=True, block_size=CSV_BLOCK_SIZE),
+                           parse_options=pa_csv.ParseOptions(delimiter='\t', quote_char=False),
+                           convert_options=pa_csv.ConvertOptions(column_types=columns,
+                                                                 include_columns=list(columns)))
+
+
+def read_filtered(reader, predicate):
+    """Reads all batches of reader, keeping rows where predicate(batch) holds."""
+    batches = [batch.filter(predicate(batch)) for batch in reader]
+    return pa.Table.from_batches(batches, schema=reader.schema)
+
+
+def read_raw_file(yq, file, columns, predicate):
+    """Reads raw SEC file of year/quarter yq, keeping rows where predicate(batch) holds.
+    The file is read from the extracted folder if it exists, otherwise it is streamed from {yq}.zip archive.
+    """
+    path = os.path.join(const.FLD_STATEMENTS_RAW, yq, file)
+    if os.path.exists(path) or not os.path.exists(get_raw_zip_path(yq)):
+        return read_filtered(open_raw_file(path, columns), predicate)
+
+    with zipfile.ZipFile(get_raw_zip_path(yq)) as archive, archive.open(file) as f:
+        return read_filtered(open_raw_file(f, columns), predicate)
+
+
+def read_sub_10k(yq, cik_sp500):
+    """Reads 10-K submissions of S&P 500 companies for year/quarter yq."""
+    cik_set = pa.array(cik_sp500, type=pa.int64())
+    return read_raw_file(yq, 'sub.txt', SUB_COLUMNS,
+                         lambda batch: pc.and_(pc.equal(batch['form'], '10-K'),
+                                               pc.is_in(batch['cik'], value_set=cik_set)))
+
+
+def read_num(yq, adsh):
+    """Reads values of submissions adsh for year/quarter yq."""
+    adsh_set = pa.array(adsh, type=pa.string())
+    return read_raw_file(yq, 'num.txt', NUM_COLUMNS, lambda batch: pc.is_in(batch['adsh'], value_set=adsh_set))
+
+
+def load_universe():
+    """Returns SEC companies (with cik numbers) and cik numbers of S&P 500 companies."""
+    sp500_list = da.get_sp500_list()
+    sec_companies = fd.fetch_sec_companies(keep_cik_num=True)
+    sp500_companies = sec_companies.loc[sec_companies['ticker'].isin(sp500_list['ticker']), :]
+    return sec_companies, sp500_companies['cik_num'].values
+
+
+def get_accepted_dates(sub_sp500, sec_companies):
+    """Returns accepted dates of 10-K submissions sub_sp500 with ticker and statement date."""
+    accepted_dates = sub_sp500.loc[:, ['adsh', 'cik', 'form', 'period', 'accepted']].copy()
+    accepted_dates['date'] = pd.to_datetime(accepted_dates['period'].astype(int), format='%Y%m%d')
+    return accepted_dates.merge(sec_companies[['cik_num', 'ticker']], left_on='cik', right_on='cik_num', how='inner')
+
+
+def get_buckets(tickers):
+    """Returns bucket of each of tickers (stable across processes and runs)."""
+    tickers = pd.Series(tickers, dtype=object)
+    buckets = {ticker: zlib.crc32(ticker.encode()) % const.N_STATEMENT_BUCKETS for ticker in tickers.unique()}
+    return tickers.map(buckets).to_numpy(dtype=np.int32)
+
+
+def remove_quarter(fld, yq):
+    """Removes extracted files of year/quarter yq from all buckets of fld."""
+    for path in glob.glob(os.path.join(fld, 'bucket=*', f'{yq}-*.parquet')):
+        os.remove(path)
+    return None
+
+
+def save_quarter(df, fld, schema, yq):
+    """Saves extracted rows of year/quarter yq partitioned by bucket of tickers, replacing its previous files."""
+    remove_quarter(fld, yq)
+
+    table = pa.Table.from_pandas(df.assign(bucket=get_buckets(df['ticker'])), schema=schema, preserve_index=False)
+    ds.write_dataset(table, fld, format='parquet', partitioning=BUCKET_PARTITIONING,
+                     basename_template=f'{yq}-{{i}}.parquet', existing_data_behavior='overwrite_or_ignore')
+    return None
+
+
+def read_bucket(fld, bucket, tickers=None):
+    """Reads rows of all extracted quarters in bucket, optionally only rows of tickers."""
+    dataset = ds.dataset(fld, format='parquet', partitioning=BUCKET_PARTITIONING)
+    expression = ds.field('bucket') == bucket
+    if tickers is not None:
+        expression = expression & ds.field('ticker').isin(list(tickers))
+    return dataset.to_table(filter=expression).to_pandas().drop(columns=['bucket'])
+
+
+def extract_quarter(yq, sec_companies, cik_sp500, concept_set=const.INGEST_CONCEPT_SET):
+    """PART 1: extracts 10-K values of S&P 500 companies for year/quarter yq and saves them (see save_quarter).
+    Only concepts of const.INGEST_CONCEPT_SETS[concept_set] are saved.
+    Returns accepted dates of the 10-K submissions (see get_accepted_dates).
+    """
+    # get relevant adsh identifiers (10K forms only for sp500 companies)
+    sub_sp500 = read_sub_10k(yq, cik_sp500).to_pandas()
+    adsh_sp500 = sub_sp500.adsh.drop_duplicates()
+
+    # fetch data with values
+    num = read_num(yq, adsh_sp500).to_pandas()
+
+    # postprocess num data
+    num['date'] = pd.to_datetime(num['ddate'], format='%Y%m%d')
+    num['source_yq'] = yq
+    num = (num
+           .merge(sub_sp500[['adsh', 'cik', 'accepted']], on='adsh', how='inner')
+           .merge(sec_companies[['cik_num', 'ticker']], left_on='cik', right_on='cik_num', how='inner'))
+
+    # save
+    cols_save = {
+        'adsh': 'adsh',
+        'date': 'date',
+        'accepted': 'accepted',
+        'ticker': 'ticker',
+        'cik': 'cik',
+        'tag': 'concept',
+        'source_yq': 'source_yq',
+        'value': 'val'
+    }
+    num_save = num.rename(columns=cols_save).loc[:, list(cols_save.values())]
+
+    # keep only whitelisted concepts, keys of all concepts are saved for Part 2 completeness check
+    concepts = const.INGEST_CONCEPT_SETS[concept_set]
+    if concepts is not None:
+        keys = num_save.loc[:, ['ticker', 'date', 'concept']].drop_duplicates()
+        save_quarter(keys, const.FLD_STATEMENTS_QUARTER_KEYS, QUARTER_KEYS_SCHEMA, yq)
+        num_save = num_save.loc[num_save['concept'].isin(concepts), :]
+
+    save_quarter(num_save, const.FLD_STATEMENTS_QUARTERS, QUARTER_SCHEMA, yq)
+
+    # accepted dates are saved as well, so that they can be rebuilt for some tickers without reading all quarters
+    accepted_dates = get_accepted_dates(sub_sp500, sec_companies)
+    save_quarter(accepted_dates.loc[:, ['ticker', 'date', 'accepted']], const.FLD_ACCEPTED_DATES_QUARTERS,
+                 QUARTER_ACCEPTED_DATES_SCHEMA, yq)
+    return accepted_dates
+
+
+def extract_quarters(years_quarters, sec_companies, cik_sp500, concept_set=const.INGEST_CONCEPT_SET,
+                     n_workers=const.N_WORKERS):
+    """PART 1: extracts all quarters of years_quarters in n_workers processes (see extract_quarter).
+    Returns dictionary mapping years/quarters to accepted dates.
+    """
+    if n_workers == 1:
+        results = map(extract_quarter, years_quarters, repeat(sec_companies), repeat(cik_sp500), repeat(concept_set))
+        accepted_dates = {}
+        for yq, accepted_dates_yq in zip(years_quarters, results):
+            print(f'processed year/quarter {yq}')
+            accepted_dates[yq] = accepted_dates_yq
+        return accepted_dates
+
+    accepted_dates = {}
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        results = executor.map(extract_quarter, years_quarters, repeat(sec_companies), repeat(cik_sp500),
+                               repeat(concept_set))
+        for idx, (yq, accepted_dates_yq) in enumerate(zip(years_quarters, results)):
+            print(f'processed year/quarter {idx + 1} out of {len(years_quarters)}')
+            accepted_dates[yq] = accepted_dates_yq
+    return accepted_dates
+
+
+def filter_statements(df_raw, keys=None):
+    """PART 2: cleans and filters extracted values of many tickers in a single vectorized pass.
+    Parameter keys holds distinct (ticker, date, concept) keys of all concepts if concepts were whitelisted in Part 1.
+    """
+    df_raw = df_raw.sort_values(['ticker', 'date', 'concept', 'source_yq'], ascending=False, kind='stable')
+
+    # filter only the last observation for each date
+    # the last row of each group in descending order, i.e. the value from the earliest source_yq
+    df_filt1 = df_raw.drop_duplicates(subset=['ticker', 'date', 'concept'], keep='last')
+
+    # get number of observations for each ticker and date
+    # filter only those with more than N_MIN_STATEMENT_RECORDS (i.e. we assume that fin.statements are complete)
+    keys = df_filt1 if keys is None else keys
+    df_n_obs = keys.groupby(['ticker', 'date']).size().rename('n_obs').reset_index(drop=False)
+    df_n_obs_min = df_n_obs.loc[df_n_obs['n_obs'] > const.N_MIN_STATEMENT_RECORDS, :].copy()
+
+    # filter only the last observation for each year
+    df_n_obs_min['year'] = df_n_obs_min['date'].dt.year
+    df_n_obs_min2 = df_n_obs_min.drop_duplicates(subset=['ticker', 'year'], keep='last')
+    return df_filt1.merge(df_n_obs_min2[['ticker', 'date']], on=['ticker', 'date'], how='inner')
+
+
+def build_statements(concept_set=const.INGEST_CONCEPT_SET, tickers=None):
+    """PART 2: builds statements of all extracted tickers, writes the statements dataset and fundamentals matrix.
+    Parameter concept_set has to be the one used in Part 1.
+    If tickers is given, only their statements are rebuilt and merged into the existing dataset.
+    """
+    statements_list = []
+
+    buckets = range(const.N_STATEMENT_BUCKETS) if tickers is None else sorted(set(get_buckets(tickers)))
+    for bucket in buckets:
+        print(f'processing bucket {bucket} out of {const.N_STATEMENT_BUCKETS}')
+        df_raw = read_bucket(const.FLD_STATEMENTS_QUARTERS, bucket, tickers)
+        keys = None
+        if const.INGEST_CONCEPT_SETS[concept_set] is not None:
+            keys = read_bucket(const.FLD_STATEMENTS_QUARTER_KEYS, bucket, tickers).drop_duplicates()
+        statements_list.append(filter_statements(df_raw, keys))
+
+    # write tickers into the parquet dataset
+    statements = pd.concat(statements_list, ignore_index=True)
+    if tickers is None:
+        da.write_statements(statements)
+    else:
+        da.merge_statements(statements, tickers)
+
+    # materialize fundamentals matrix used by the valuation runs
+    fundamentals.build_fundamentals()
+    return None
+
+
+def read_accepted_dates(tickers=None):
+    """Reads accepted dates saved by Part 1 for all extracted quarters, optionally only for tickers."""
+    buckets = range(const.N_STATEMENT_BUCKETS) if tickers is None else sorted(set(get_buckets(tickers)))
+    return pd.concat([read_bucket(const.FLD_ACCEPTED_DATES_QUARTERS, bucket, tickers) for bucket in buckets],
+                     ignore_index=True)
+
+
+def process_accepted_dates(accepted_dates_list, tickers=None):
+    """Gets the first accepted date for each ticker and statement date with share prices around it and saves it.
+    If tickers is given, only their rows of the existing file are replaced.
+    """
+    accepted_dates = pd.concat(accepted_dates_list)
+
+    # group by ticker and date and get the first accepted date
+    accepted_dates_min = accepted_dates.groupby(['ticker', 'date']).agg({'accepted': 'min'}).reset_index(drop=False)
+
+    # convert accepted date to datetime
+    accepted_dates_min['accepted'] = pd.to_datetime(accepted_dates_min['accepted'])
+
+    # get share prices just before and after the accepted date
+    accepted_dates_min = da.get_share_prices_around_dates(accepted_dates_min, offsets=[-1, 1])
+
+    accepted_dates_min['days_dif'] = (pd.to_datetime(accepted_dates_min['accepted']) -
+                                      pd.to_datetime(accepted_dates_min['date'])).dt.days
+
+    if tickers is not None and os.path.exists(const.PATH_ACCEPTED_DATES):
+        existing = pd.read_csv(const.PATH_ACCEPTED_DATES, parse_dates=['date', 'accepted'])
+        accepted_dates_min = (pd.concat([existing.loc[~existing['ticker'].isin(tickers), :], accepted_dates_min])
+                              .sort_values(['ticker', 'date'])
+                              .reset_index(drop=True))
+
+    utils.maybe_make_dir(const.FLD_ACCEPTED_DATES)
+    utils.write_csv_atomic(accepted_dates_min, const.PATH_ACCEPTED_DATES)
+    return accepted_dates_min
+
+
+def remove_accepted_dates(tickers):
+    """Removes rows of tickers from the saved accepted dates, e.g. if their quarters were removed."""
+    if not os.path.exists(const.PATH_ACCEPTED_DATES):
+        return None
+    existing = pd.read_csv(const.PATH_ACCEPTED_DATES, parse_dates=['date', 'accepted'])
+    utils.write_csv_atomic(existing.loc[~existing['ticker'].isin(tickers), :], const.PATH_ACCEPTED_DATES)
+    return None
+
+
+def get_file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(8 * 1024 ** 2), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def get_file_state(path, state=None):
+    """Returns size, modification time and sha256 checksum of file path.
+    Checksum of the previous state is reused if size and modification time did not change.
+    """
+    stat = os.stat(path)
+    if state is not None and state['size'] == stat.st_size and state['mtime'] == stat.st_mtime:
+        return state
+    return {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': get_file_sha256(path)}
+
+
+def get_universe_hash(sec_companies, cik_sp500):
+    """Returns hash of the ticker/cik pairs of S&P 500 companies, extracted quarters depend on it."""
+    universe = sec_companies.loc[sec_companies['cik_num'].isin(cik_sp500), ['cik_num', 'ticker']]
+    pairs = sorted(zip(universe['cik_num'].astype(int), universe['ticker']))
+    return hashlib.sha256(json.dumps(pairs).encode()).hexdigest()
+
+
+def get_quarter_entry(yq, universe_hash, concept_set, entry=None):
+    """Returns manifest entry of year/quarter yq, entry is the previous one (checksums are reused if unchanged)."""
+    files = {} if entry is None else entry['files']
+    return {
+        'files': {path: get_file_state(path, files.get(path)) for path in get_raw_paths(yq)},
+        'universe': universe_hash,
+        'concept_set': concept_set,
+    }
+
+
+def is_quarter_changed(entry_new, entry):
+    if entry is None:
+        return True
+    checksums_new = {path: state['sha256'] for path, state in entry_new['files'].items()}
+    checksums = {path: state['sha256'] for path, state in entry['files'].items()}
+    return (checksums_new != checksums or entry_new['universe'] != entry['universe'] or
+            entry_new['concept_set'] != entry['concept_set'])
+
+
+def load_manifest():
+    if not os.path.exists(const.PATH_STATEMENTS_MANIFEST):
+        return {}
+    with open(const.PATH_STATEMENTS_MANIFEST) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest):
+    # write to temporary file first, so that the manifest is never left partially written
+    utils.maybe_make_dir(os.path.dirname(const.PATH_STATEMENTS_MANIFEST))
+    path_tmp = f'{const.PATH_STATEMENTS_MANIFEST}.{os.getpid()}.tmp'
+    with open(path_tmp, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path_tmp, const.PATH_STATEMENTS_MANIFEST)
+    return None
+
+
+def ingest(years_quarters=None, concept_set=const.INGEST_CONCEPT_SET, full_rebuild=False, n_workers=const.N_WORKERS):
+    """Ingests raw SEC quarters (all available in the raw folder by default) into the statements dataset, fundamentals
+    matrix and accepted dates.
+    Only quarters which are new or changed since the last ingest are extracted (Part 1), statements and accepted dates
+    are rebuilt and merged only for tickers with 10-K filings in them, either now or in the previous ingest.
+    Extracted files and manifest entries of quarters whose raw files were deleted are removed, together with their
+    statements and accepted dates.
+    Everything is rebuilt if full_rebuild is set or there is no previous ingest, in which case previously extracted
+    quarters are deleted first. Returns list of ingested quarters.
+    """
+    raw_quarters = get_raw_quarters()
+    years_quarters = raw_quarters if years_quarters is None else years_quarters
+    sec_companies, cik_sp500 = load_universe()
+    universe_hash = get_universe_hash(sec_companies, cik_sp500)
+
+    manifest = load_manifest()
+    if full_rebuild or not os.path.isdir(const.FLD_STATEMENTS_DATASET):
+        manifest = {}
+    incremental = len(manifest) > 0
+    if not incremental:
+        # quarters extracted before are stale, e.g. of a different concept set or of deleted raw files
+        for fld in QUARTER_FOLDERS:
+            shutil.rmtree(fld, ignore_errors=True)
+
+    entries = {yq: get_quarter_entry(yq, universe_hash, concept_set, manifest.get(yq)) for yq in years_quarters}
+    changed = [yq for yq in years_quarters if is_quarter_changed(entries[yq], manifest.get(yq))]
+    # quarters whose raw files were deleted since the last ingest
+    removed = [yq for yq in sorted(manifest) if yq not in raw_quarters]
+    if len(changed) == 0 and len(removed) == 0:
+        print('no new, changed or removed quarters')
+        return []
+    print(f'ingesting {len(changed)} out of {len(years_quarters)} quarters, removing {len(removed)} quarters')
+
+    for yq in removed:
+        for fld in QUARTER_FOLDERS:
+            remove_quarter(fld, yq)
+
+    # PART 1
+    accepted_dates = extract_quarters(changed, sec_companies, cik_sp500, concept_set, n_workers)
+
+    # tickers of the changed and removed quarters, including those which are no longer present in them
+    tickers = set()
+    for yq in changed:
+        entries[yq]['tickers'] = sorted(accepted_dates[yq]['ticker'].unique())
+        tickers.update(entries[yq]['tickers'])
+    for yq in changed + removed:
+        tickers.update(manifest.get(yq, {}).get('tickers', []))
+    tickers = sorted(tickers) if incremental else None
+
+    if tickers is None or len(tickers) > 0:
+        # PART 2
+        build_statements(concept_set, tickers)
+
+        # ACCEPTED DATE PROCESSING
+        accepted_dates_all = read_accepted_dates(tickers)
+        if accepted_dates_all.shape[0] > 0:
+            process_accepted_dates([accepted_dates_all], tickers)
+        elif tickers is not None:
+            remove_accepted_dates(tickers)
+
+    for yq in years_quarters:
+        manifest[yq] = dict(manifest.get(yq, {}), **entries[yq])
+    for yq in removed:
+        del manifest[yq]
+    save_manifest(manifest)
+    return changed
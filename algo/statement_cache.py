@@ -0,0 +1,81 @@
+"""
+This module contains an in-memory cache of per-ticker financial statements.
+Each ticker file is loaded once and indexed by (concept, year), so repeated lookups do not re-read the statement files.
+"""
+
+from collections import OrderedDict
+import pandas as pd
+import algo.constants as const
+import algo.profiling as profiling
+
+
+class TickerStatements:
+    """Statements of a single ticker indexed by (concept, year)."""
+
+    def __init__(self, ticker, data):
+        self.ticker = ticker
+        self.data = data.loc[data['ticker'] == ticker, ['ticker', 'date', 'accepted', 'concept', 'val']] \
+            .reset_index(drop=True)
+        self.data['year'] = pd.to_datetime(self.data['date']).dt.year
+
+        # map (concept, year) to all values observed for that key
+        vals = self.data['val'].to_numpy()
+        self.values = {key: vals[idx] for key, idx in self.data.groupby(['concept', 'year']).indices.items()}
+
+        self.dates = self.data['date'].drop_duplicates().sort_values().to_list()
+        self.nbytes = int(self.data.memory_usage(deep=True).sum())
+        self._accepted_dates = None
+
+    def get_values(self, concept, year):
+        """Returns array of values for concept and year (empty if there is no observation)."""
+        return self.values.get((concept, year), self.data['val'].to_numpy()[:0])
+
+    def get_accepted_dates(self):
+        """Returns the most frequent accepted date for each statement date, including the count column."""
+        if self._accepted_dates is None:
+            res = self.data[['accepted', 'date']].copy()
+
+            # count number of rows per date and keep the most frequent accepted date within each date
+            res['count'] = res.groupby('date')['accepted'].transform('count')
+            res = res.sort_values('count', ascending=False)
+            self._accepted_dates = res.groupby('date').first().reset_index()
+
+        return self._accepted_dates.copy()
+
+
+class StatementCache:
+    """LRU cache of TickerStatements. Whole tickers are evicted once max_bytes is exceeded.
+    Parameter loader is a function returning statement dataframe for a ticker.
+    """
+
+    def __init__(self, loader, max_bytes=const.STATEMENT_CACHE_MAX_BYTES):
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._tickers = OrderedDict()
+
+    def get(self, ticker):
+        """Returns TickerStatements for ticker, loading them on the first access."""
+        if ticker in self._tickers:
+            self._tickers.move_to_end(ticker)
+            profiling.count('statement_cache.hits')
+            return self._tickers[ticker]
+
+        profiling.count('statement_cache.misses')
+        statements = TickerStatements(ticker, self.loader(ticker))
+        self._tickers[ticker] = statements
+        self.nbytes += statements.nbytes
+        self._evict()
+        return statements
+
+    def _evict(self):
+        """Evicts least recently used tickers, always keeping the most recent one."""
+        while self.nbytes > self.max_bytes and len(self._tickers) > 1:
+            _, evicted = self._tickers.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+    def clear(self):
+        """Drops all cached tickers."""
+        self._tickers.clear()
+        self.nbytes = 0
+
@@ -0,0 +1,92 @@
+"""
+This module contains a local stub HTTP server standing in for Yahoo and SEC in tests and benchmarks.
+Responses are served from a dictionary of routes (request path without query -> body), unknown paths return 404.
+Responses carry ETag of the body and requests with matching If-None-Match get 304 (see algo.http_client).
+Latency of the real services and transient failures (the first n_failures requests of each path return 503) can be
+simulated to exercise the concurrency, rate limiting and retries of algo.downloader.
+Point the code to the server by base url parameters or by environment variables ALGO_URL_YAHOO, ALGO_URL_SEC_DATA
+and ALGO_URL_SEC_WWW.
+"""
+
+import hashlib
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+
+class StubServer:
+    """Stub HTTP server running in a background thread, usable as context manager."""
+
+    def __init__(self, routes, latency=0.0, n_failures=0, content_type='text/html; charset=utf-8'):
+        self.routes = routes
+        self.latency = latency
+        self.n_failures = n_failures
+        self.content_type = content_type
+        # path -> number of requests
+        self.requests = defaultdict(int)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        return None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def respond(self, path, etag_request=None):
+        """Returns status code, body and ETag of response to request path (etag of If-None-Match header)."""
+        with self._lock:
+            self.requests[path] += 1
+            n_requests = self.requests[path]
+        time.sleep(self.latency)
+
+        if n_requests <= self.n_failures:
+            return 503, b'service unavailable', None
+        if path not in self.routes:
+            return 404, b'not found', None
+        body = self.routes[path]
+        body = body.encode() if isinstance(body, str) else body
+        etag = f'"{hashlib.sha256(body).hexdigest()}"'
+        if etag == etag_request:
+            return 304, b'', etag
+        return 200, body, etag
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, body, etag = stub.respond(urlsplit(self.path).path, self.headers.get('If-None-Match'))
+                self.send_response(status)
+                self.send_header('Content-Type', stub.content_type)
+                if etag is not None:
+                    self.send_header('ETag', etag)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,254 @@
+"""
+This module generates deterministic synthetic data in the layout of the data folder, used by benchmarks.
+Real data can not be redistributed, the synthetic data only mimic their formats and sizes.
+Generated are statement csv files, share price histories, betas, ERP and T-note series, S&P 500 returns,
+SEC company list and S&P 500 list snapshots, raw SEC quarters (sub.txt and num.txt) and XBRL company facts bundle.
+All paths are relative to the root folder, i.e. code using algo.constants has to run with root as working directory.
+"""
+
+import json
+import os
+import zipfile
+import numpy as np
+import pandas as pd
+import algo.constants as const
+
+# fraction of the scale of each ticker (revenue-like) reported for the model concepts
+MODEL_CONCEPT_RATIOS = {
+    'InterestExpense': 0.02,
+    'IncomeTaxExpenseBenefit': 0.04,
+    const.FUNDAMENTAL_CONCEPTS['pretax_income'][0]: 0.2,
+    'LongTermDebtNoncurrent': 0.5,
+    'CapitalLeaseObligationsNoncurrent': 0.05,
+    'OperatingIncomeLoss': 0.22,
+    'NetCashProvidedByUsedInOperatingActivities': 0.25,
+    'NetIncomeLoss': 0.16,
+    'ShareBasedCompensation': 0.01,
+    'PaymentsToAcquirePropertyPlantAndEquipment': 0.08,
+    'CashAndCashEquivalentsAtCarryingValue': 0.1,
+    'CurrentDebt': 0.05,
+}
+
+# number of concepts reported in 10-Q filings of the raw quarters
+N_10Q_CONCEPTS = 40
+
+
+def get_tickers(n_tickers):
+    return [f'T{idx:04d}' for idx in range(n_tickers)]
+
+
+def get_fiscal_years(years_quarters):
+    """Fiscal years whose 10-K filings (filed in the first quarter of the next year) are within years_quarters."""
+    return sorted(int(yq[:4]) - 1 for yq in years_quarters if yq.endswith('q1'))
+
+
+def write_csv(df, root, fld, file):
+    os.makedirs(os.path.join(root, fld), exist_ok=True)
+    df.to_csv(os.path.join(root, fld, file), index=False)
+    return None
+
+
+def generate_statements(rng, tickers, ciks, fiscal_years, n_filler_concepts, missing_rate):
+    """Generates 10-K statement values of all tickers, one row per ticker, fiscal year and concept."""
+    filler_concepts = [f'SyntheticConcept{idx:03d}' for idx in range(n_filler_concepts)]
+    rows = []
+
+    for ticker, cik in zip(tickers, ciks):
+        scale = rng.uniform(1e9, 1e11)
+        shares = rng.uniform(1e8, 5e9)
+        growth = rng.normal(0.05, 0.1, len(fiscal_years))
+
+        for year, year_growth in zip(fiscal_years, growth):
+            scale *= 1 + year_growth
+            values = {concept: scale * ratio * rng.uniform(0.8, 1.2) for concept, ratio in MODEL_CONCEPT_RATIOS.items()}
+            values['CommonStockSharesOutstanding'] = shares
+            values.update({concept: rng.uniform(-1e9, 1e9) for concept in filler_concepts})
+
+            # randomly missing values exercise fallback concepts and error paths
+            values = {concept: val for concept, val in values.items() if rng.uniform() >= missing_rate}
+
+            accepted = (pd.Timestamp(f'{year + 1}-02-01') + pd.Timedelta(days=int(rng.integers(0, 40)),
+                                                                       minutes=int(rng.integers(0, 600))))
+            for concept, val in values.items():
+                rows.append((f'{cik:010d}-{year + 1 - 2000:02d}-000001', f'{year}-12-31',
+                             accepted.strftime('%Y-%m-%d %H:%M:%S.0'), ticker, cik, concept, f'{year + 1}q1',
+                             round(val)))
+
+    return pd.DataFrame(rows, columns=['adsh', 'date', 'accepted', 'ticker', 'cik', 'concept', 'source_yq', 'val'])
+
+
+def generate_raw_quarters(rng, root, statements, years_quarters, noise_ciks, zip_quarters=False):
+    """Writes raw SEC quarters. 10-K filings of the statements also report values of the previous fiscal year,
+    10-Q filings and filings of companies outside the universe are added as noise.
+    Quarters are written as {yq}.zip archives (as downloaded from the SEC) if zip_quarters is True.
+    """
+    prev_values = statements.assign(date=(pd.to_datetime(statements['date']) - pd.DateOffset(years=1))
+                                    .dt.strftime('%Y-%m-%d'))
+    values_all = pd.concat([statements, prev_values], ignore_index=True)
+
+    for yq in years_quarters:
+        year, quarter = int(yq[:4]), int(yq[-1])
+        filed = pd.Timestamp(year=year, month=3 * quarter - 1, day=15)
+
+        # 10-K filings of the statements
+        values = values_all.loc[values_all['source_yq'] == yq, :]
+        sub_10k = values.drop_duplicates('adsh').loc[:, ['adsh', 'cik', 'date', 'accepted']]
+        sub_10k['form'] = '10-K'
+        sub_10k['fp'] = 'FY'
+        num = pd.DataFrame({'adsh': values['adsh'], 'tag': values['concept'], 'version': 'us-gaap/2020',
+                            'coreg': '', 'ddate': values['date'].str.replace('-', ''), 'qtrs': 4, 'uom': 'USD',
+                            'value': values['val'], 'footnote': ''})
+
+        # 10-Q filings and filings of other companies
+        ciks_10q = np.concatenate([statements['cik'].unique(), noise_ciks])
+        period = (filed - pd.offsets.QuarterEnd(1)).strftime('%Y-%m-%d')
+        sub_10q = pd.DataFrame({'adsh': [f'{cik:010d}-{year - 2000:02d}-{100000 + quarter:06d}' for cik in ciks_10q],
+                                'cik': ciks_10q, 'date': period, 'accepted': f'{filed:%Y-%m-%d} 16:30:00.0',
+                                'form': '10-Q', 'fp': f'Q{quarter}'})
+        num_10q = pd.DataFrame({'adsh': np.repeat(sub_10q['adsh'].to_numpy(), N_10Q_CONCEPTS),
+                                'tag': np.tile([f'SyntheticConcept{idx:03d}' for idx in range(N_10Q_CONCEPTS)],
+                                               len(ciks_10q)),
+                                'version': 'us-gaap/2020', 'coreg': '', 'ddate': period.replace('-', ''), 'qtrs': 1,
+                                'uom': 'USD', 'value': rng.integers(-10 ** 9, 10 ** 9, len(ciks_10q) * N_10Q_CONCEPTS),
+                                'footnote': ''})
+
+        sub = pd.concat([sub_10k, sub_10q], ignore_index=True)
+        sub = pd.DataFrame({'adsh': sub['adsh'], 'cik': sub['cik'], 'name': 'SYNTHETIC CORP', 'sic': 1000,
+                            'form': sub['form'], 'period': pd.to_datetime(sub['date']).dt.strftime('%Y%m%d'),
+                            'fy': year, 'fp': sub['fp'], 'filed': sub['accepted'].str[:10].str.replace('-', ''),
+                            'accepted': sub['accepted']})
+
+        num = pd.concat([num, num_10q], ignore_index=True)
+        if zip_quarters:
+            os.makedirs(os.path.join(root, const.FLD_STATEMENTS_RAW), exist_ok=True)
+            with zipfile.ZipFile(os.path.join(root, const.FLD_STATEMENTS_RAW, f'{yq}.zip'), 'w',
+                                 compression=zipfile.ZIP_DEFLATED) as archive:
+                archive.writestr('sub.txt', sub.to_csv(sep='\t', index=False))
+                archive.writestr('num.txt', num.to_csv(sep='\t', index=False))
+        else:
+            fld = os.path.join(root, const.FLD_STATEMENTS_RAW, yq)
+            os.makedirs(fld, exist_ok=True)
+            sub.to_csv(os.path.join(fld, 'sub.txt'), sep='\t', index=False)
+            num.to_csv(os.path.join(fld, 'num.txt'), sep='\t', index=False)
+
+    return None
+
+
+def generate_companyfacts(root, statements, noise_ciks):
+    """Writes company facts bundle of the statements. Each 10-K also reports values of the previous fiscal year,
+    flow concepts are annual durations and also have a quarterly value, companies outside the universe have 10-Q facts.
+    """
+    flow_concepts = set(MODEL_CONCEPT_RATIOS) - {'LongTermDebtNoncurrent', 'CapitalLeaseObligationsNoncurrent',
+                                                 'CashAndCashEquivalentsAtCarryingValue', 'CurrentDebt'}
+    prev_values = statements.assign(date=(pd.to_datetime(statements['date']) - pd.DateOffset(years=1))
+                                    .dt.strftime('%Y-%m-%d'))
+    values_all = pd.concat([statements, prev_values], ignore_index=True)
+
+    os.makedirs(os.path.join(root, const.FLD_COMPANYFACTS), exist_ok=True)
+    with zipfile.ZipFile(os.path.join(root, const.PATH_COMPANYFACTS_BUNDLE), 'w',
+                         compression=zipfile.ZIP_DEFLATED) as archive:
+        for cik, values_cik in values_all.groupby('cik'):
+            facts = {}
+            for row in values_cik.itertuples():
+                entry = {'end': row.date, 'val': row.val, 'accn': row.adsh, 'fy': int(row.date[:4]), 'fp': 'FY',
+                         'form': '10-K', 'filed': row.accepted[:10]}
+                entries = facts.setdefault(row.concept, {'units': {'USD': []}})['units']['USD']
+                if row.concept in flow_concepts:
+                    start = (pd.Timestamp(row.date) - pd.DateOffset(years=1) + pd.DateOffset(days=1))
+                    start_quarter = (pd.Timestamp(row.date) - pd.DateOffset(months=3) + pd.DateOffset(days=1))
+                    entries.append(dict(entry, start=start.strftime('%Y-%m-%d')))
+                    entries.append(dict(entry, start=start_quarter.strftime('%Y-%m-%d'), val=row.val / 4))
+                else:
+                    entries.append(entry)
+            archive.writestr(f'CIK{cik:010d}.json', json.dumps({'cik': int(cik), 'facts': {'us-gaap': facts}}))
+
+        for cik in noise_ciks:
+            facts = {f'SyntheticConcept{idx:03d}': {'units': {'USD': [
+                {'end': '2010-03-31', 'val': idx, 'accn': f'{cik:010d}-10-000001', 'form': '10-Q',
+                 'filed': '2010-05-01'}]}} for idx in range(N_10Q_CONCEPTS)}
+            archive.writestr(f'CIK{cik:010d}.json', json.dumps({'cik': int(cik), 'facts': {'us-gaap': facts}}))
+    return None
+
+
+def generate_share_prices(rng, root, tickers, statements, days):
+    """Writes share price histories, price levels roughly follow the net income of each ticker."""
+    medians = statements.groupby(['concept', 'ticker'])['val'].median()
+    net_income, shares = medians['NetIncomeLoss'], medians['CommonStockSharesOutstanding']
+
+    for ticker in tickers:
+        start = 15 * abs(net_income.get(ticker, 1e9)) / shares.get(ticker, 1e9)
+        close = start * np.exp(np.cumsum(rng.normal(0.0003, 0.02, len(days))))
+        history = pd.DataFrame({'Date': days.strftime('%Y-%m-%d'), 'Open': close, 'High': close, 'Low': close,
+                                'Close': close.round(4), 'Volume': rng.integers(10 ** 5, 10 ** 7, len(days))})
+        write_csv(history, root, const.FLD_SHARE_PRICES, f'{ticker}.csv')
+    return None
+
+
+def generate_market_data(rng, root, tickers, fiscal_years, days):
+    """Writes betas, T-note and ERP series, S&P 500 returns and implied perpetual growth rate percentiles."""
+    write_csv(pd.DataFrame({'ticker': tickers, 'beta': rng.uniform(0.5, 1.8, len(tickers)).round(3)}),
+              root, const.FLD_BETAS, const.FILE_BETAS)
+
+    calendar_days = pd.date_range(days[0], days[-1])
+    write_csv(pd.DataFrame({'Date': calendar_days.strftime('%Y-%m-%d'),
+                            'DGS10': rng.uniform(0.5, 5, len(calendar_days)).round(2)}),
+              root, const.FLD_TNOTES, const.FILE_TNOTES)
+
+    month_ends = pd.date_range(days[0], days[-1], freq='ME')
+    write_csv(pd.DataFrame({'date': month_ends.strftime('%Y-%m-%d'),
+                            'erp_fcfe_sustainable_payout': rng.uniform(0.04, 0.06, len(month_ends)),
+                            'analyst_growth_estimate': rng.uniform(0.03, 0.08, len(month_ends))}),
+              root, const.FLD_ERP, const.FILE_ERP)
+
+    close = 1000 * np.exp(np.cumsum(rng.normal(0.0003, 0.01, len(days))))
+    write_csv(pd.DataFrame({'Date': days.strftime('%Y-%m-%d'), 'Close': close,
+                            'return': pd.Series(close).pct_change(periods=252)}),
+              root, const.FLD_SP500_RETURNS, const.FILE_SP500_RETURNS)
+
+    write_csv(pd.DataFrame({'year': fiscal_years, 'implied_perp_g_rate': rng.uniform(0.01, 0.04, len(fiscal_years))}),
+              root, const.FLD_IMPLIED_PERP_G_RATES, const.FILE_IMPLIED_PERP_G_RATES_P50)
+    return None
+
+
+def generate_company_lists(root, tickers, ciks, noise_ciks):
+    """Writes the SEC company list and S&P 500 list snapshots."""
+    companies = ([(cik, ticker) for cik, ticker in zip(ciks, tickers)] +
+                 [(cik, f'N{idx:04d}') for idx, cik in enumerate(noise_ciks)])
+    os.makedirs(os.path.join(root, const.FLD_SEC_COMPANIES), exist_ok=True)
+    with open(os.path.join(root, const.PATH_SEC_COMPANIES), 'w') as f:
+        json.dump({str(idx): {'cik_str': int(cik), 'ticker': ticker, 'title': f'{ticker} SYNTHETIC CORP'}
+                   for idx, (cik, ticker) in enumerate(companies)}, f)
+
+    write_csv(pd.DataFrame({'ticker': tickers, 'date_added': '2000-01-01'}),
+              root, const.FLD_SP500_LIST, const.FILE_SP500_LIST)
+    return None
+
+
+def generate(root, n_tickers=50, years_quarters=None, n_filler_concepts=100, n_noise_companies=200,
+             missing_rate=0.01, zip_quarters=False, seed=0):
+    """Generates all synthetic datasets into root folder.
+    Statements are written as per-ticker csv files (FLD_STATEMENTS), as raw SEC quarters (FLD_STATEMENTS_RAW) and as
+    company facts bundle (PATH_COMPANYFACTS_BUNDLE), raw quarters are zip archives if zip_quarters is True.
+    Returns the list of generated tickers.
+    """
+    years_quarters = const.YEARS_QUARTERS if years_quarters is None else years_quarters
+    rng = np.random.default_rng(seed)
+
+    tickers = get_tickers(n_tickers)
+    ciks = np.arange(1000, 1000 + n_tickers)
+    noise_ciks = np.arange(100000, 100000 + n_noise_companies)
+    fiscal_years = get_fiscal_years(years_quarters)
+    days = pd.bdate_range(f'{fiscal_years[0] - 1}-01-01', f'{int(years_quarters[-1][:4])}-12-31')
+
+    statements = generate_statements(rng, tickers, ciks, fiscal_years, n_filler_concepts, missing_rate)
+    os.makedirs(os.path.join(root, const.FLD_STATEMENTS), exist_ok=True)
+    for ticker, statements_ticker in statements.groupby('ticker'):
+        statements_ticker.to_csv(os.path.join(root, const.FLD_STATEMENTS, f'{ticker}.csv'), index=False)
+
+    generate_raw_quarters(rng, root, statements, years_quarters, noise_ciks, zip_quarters)
+    generate_companyfacts(root, statements, noise_ciks)
+    generate_share_prices(rng, root, tickers, statements, days)
+    generate_market_data(rng, root, tickers, fiscal_years, days)
+    generate_company_lists(root, tickers, ciks, noise_ciks)
+
+    return tickers
@@ -1,6 +1,7 @@
 import traceback
 import os
 import algo.constants as const
+import algo.results_store as results_store
 import pandas as pd
 import numpy as np
 
@@ -26,23 +27,16 @@ def maybe_make_dir(directory):
 
 
 def upsert_results(df, add_timestamp=True):
-    """Upsert results to csv file. If file does not exist, create it. If it exists, upserts new results."""
-    # add created column
-    if add_timestamp:
-        df['created'] = pd.Timestamp.now().strftime(format='%Y-%m-%d %H:%M:%S')
+    """Upsert intrinsic value results into the results store (see algo.results_store)."""
+    results_store.upsert(results_store.TABLE_INTRINSIC_VALUES, df, add_created=add_timestamp)
+    return None
 
-    fld_save = maybe_make_dir(const.FLD_RESULTS_INTRINSIC_VALUES)
-    full_path = os.path.join(fld_save, const.FILE_RESULTS_INTRINSIC_VALUES)
-    if const.FILE_RESULTS_INTRINSIC_VALUES not in os.listdir(fld_save):
-        df.to_csv(full_path, index=False)
-    else:
-        # load existing results
-        result = pd.read_csv(full_path)
 
-        # upsert
-        result = pd.concat([result, df])
-        result = result.drop_duplicates(subset=['ticker', 'date'], keep='last')
-        result.to_csv(full_path, index=False)
+def write_csv_atomic(df, full_path):
+    """Writes df to csv via temporary file, so that the file is never left partially written."""
+    path_tmp = f'{full_path}.{os.getpid()}.tmp'
+    df.to_csv(path_tmp, index=False)
+    os.replace(path_tmp, full_path)
     return None
 
 
@@ -61,7 +55,7 @@ def upsert_into_df(df, save_fld, save_file, index_cols, add_created=True):
     full_path = os.path.join(save_fld, save_file)
 
     if save_file not in os.listdir(save_fld):
-        df.to_csv(full_path, index=False)
+        write_csv_atomic(df, full_path)
     else:
         # load existing results
         result = pd.read_csv(full_path)
@@ -69,7 +63,7 @@ def upsert_into_df(df, save_fld, save_file, index_cols, add_created=True):
         # upsert
         result = pd.concat([result, df])
         result = result.drop_duplicates(subset=index_cols, keep='last')
-        result.to_csv(full_path, index=False)
+        write_csv_atomic(result, full_path)
     return None
 
 